@@ -1,7 +1,131 @@
-from flask import Blueprint, jsonify
+import re
+
+from flask import Blueprint, jsonify, request, abort, current_app
+
+import firebase_service as fb
+import mailer
+import profiling
+import search_index
+from utils import get_current_user, conditional, compress_response
 
 api_bp = Blueprint('api', __name__)
 
 @api_bp.route('/health')
 def health():
-    return jsonify({"status": "ok"})
\ No newline at end of file
+    """Liveness, plus whether outgoing mail is currently failing (details in /api/metrics)."""
+    mail = mailer.get_mailer()
+    state = "unconfigured" if mail is None else "failing" if mail.stats()['failing'] else "ok"
+    return jsonify({"status": "ok", "mail": state})
+
+@api_bp.route('/warmup')
+def warmup():
+    """Initialise Firestore ahead of real traffic (e.g. from a scheduled ping)."""
+    ready = fb.warm_up()
+    timings = {k: round(v * 1000, 1) for k, v in fb.init_timings.items()}
+    return jsonify({"status": "ok" if ready else "error", "init_ms": timings}), 200 if ready else 503
+
+@api_bp.route('/metrics')
+def metrics():
+    """Process totals in the Prometheus text format (only while PROFILING is on)."""
+    if not profiling.enabled:
+        abort(404)
+    token = current_app.config.get('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        abort(401)
+    mail = mailer.get_mailer()
+    body = profiling.metrics.render(fb.get_cache_stats(), mail.stats() if mail else None)
+    return body, 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+
+# ==================== SECTION CONTENT (v1) ====================
+# JSON view of the logged-in user's section:
+#   GET /api/v1/<kind>?fields=title,date&cursor=...&limit=...   newest first, paged
+#   GET /api/v1/notes?semester=3&...                            one semester's notes, paged
+#   GET /api/v1/<kind>?since=<sync token>                        changes since a sync
+# A client lists everything once, keeping the first page's "since" token,
+# then keeps calling with since=<the last response's "since"> (or since=0
+# for everything) to receive new or changed items and the ids of deleted
+# ones; while "has_more" is set, call again right away. Responses are
+# ETag-revalidated like the HTML pages and compressed.
+API_KINDS = ('announcements', 'notes', 'contacts')
+MAX_API_LIMIT = 100
+FIELD_NAME = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+api_bp.after_request(compress_response)
+
+
+def _fields_or_400():
+    fields = [f for f in request.args.get('fields', '').split(',') if f]
+    if not all(FIELD_NAME.match(f) for f in fields):
+        abort(400)
+    return fields
+
+
+@api_bp.route('/v1/<kind>')
+def section_content(kind):
+    if kind not in API_KINDS:
+        abort(404)
+    # Same ETag/304 handling as the HTML pages, for the one kind requested
+    return conditional(kind)(_section_content)(kind)
+
+
+def _section_content(kind):
+    user = get_current_user()
+    if not user:
+        return jsonify({"status": "error", "message": "Invalid session"}), 401
+    section = user.get('section')
+    fields = _fields_or_400()
+    limit = min(max(request.args.get('limit', fb.PAGE_SIZE, type=int), 1), MAX_API_LIMIT)
+
+    since = request.args.get('since')
+    if since is not None:
+        try:
+            items, deleted, has_more, token = fb.get_changes(kind, section, since, limit, fields)
+        except fb.SyncTokenExpired:
+            return jsonify({"status": "error", "message": "Sync token expired; list the items again"}), 410
+        except ValueError:
+            abort(400)
+        except RuntimeError:
+            return jsonify({"status": "error", "message": "Try again later"}), 503
+        return jsonify({"status": "success", "items": fb.project(items, fields),
+                        "deleted": [d['id'] for d in deleted],
+                        "has_more": has_more, "since": token})
+
+    # Taken before the listing is read, so the listing can't be newer than it
+    token = fb.listing_sync_token()
+    if kind == 'contacts':
+        # Small and unordered: always returned whole, from the content cache
+        return jsonify({"status": "success", "items": fb.project(fb.get_contacts(section), fields),
+                        "next_cursor": None, "since": token})
+    cursor = request.args.get('cursor')
+    try:
+        items, next_cursor = fb.get_page(kind, section, limit=limit, cursor=cursor, fields=fields,
+                                         semester=request.args.get('semester') if kind == 'notes' else None)
+    except ValueError:
+        abort(400)
+    res = {"status": "success", "items": items, "next_cursor": next_cursor}
+    if not cursor:
+        res["since"] = token
+    return jsonify(res)
+
+
+@api_bp.route('/v1/search')
+@conditional('notes', 'announcements')
+def search():
+    """Ranked notes and announcements of the user's section: ?q=&kinds=&limit=&page=."""
+    user = get_current_user()
+    if not user:
+        return jsonify({"status": "error", "message": "Invalid session"}), 401
+    kinds = [k for k in request.args.get('kinds', '').split(',') if k]
+    if any(k not in search_index.INDEXED for k in kinds):
+        abort(400)
+    fields = _fields_or_400()
+    limit = min(max(request.args.get('limit', fb.PAGE_SIZE, type=int), 1), MAX_API_LIMIT)
+    page = max(request.args.get('page', 1, type=int), 1)
+
+    items, total = fb.search(user.get('section'), request.args.get('q', ''), kinds=kinds or None,
+                             limit=limit, offset=(page - 1) * limit)
+    if fields:
+        fields += ['kind', 'score']
+    return jsonify({"status": "success", "items": fb.project(items, fields),
+                    "total": total, "page": page, "has_more": page * limit < total})
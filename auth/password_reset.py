@@ -1,11 +1,13 @@
 from flask import Blueprint, render_template, request, jsonify, redirect, url_for, flash
 import firebase_service as fb
 import otp_service
+import rate_limit
 from werkzeug.security import generate_password_hash
 
 password_reset_bp = Blueprint('password_reset', __name__, url_prefix='/password-reset')
 
 @password_reset_bp.route('/request', methods=['GET', 'POST'])
+@rate_limit.throttle('otp_request', success=False)
 def request_otp():
     """Step 1: Request OTP for password reset"""
     if request.method == 'POST':
@@ -40,6 +42,7 @@ def request_otp():
     return render_template('password_reset/request_otp.html')
 
 @password_reset_bp.route('/verify', methods=['GET', 'POST'])
+@rate_limit.throttle('otp_verify', success=False)
 def verify_otp():
     """Step 2: Verify OTP"""
     if request.method == 'POST':
@@ -80,7 +83,7 @@ def reset_password():
             return jsonify({'success': False, 'message': 'Passwords do not match'}), 400
         
         # Verify OTP was verified (check if it exists and is marked as used)
-        if username not in otp_service.otp_storage or not otp_service.otp_storage[username].get('used'):
+        if not otp_service.is_otp_verified(username):
             return jsonify({'success': False, 'message': 'Please verify OTP first'}), 400
         
         # Get user
@@ -93,11 +96,13 @@ def reset_password():
         user['password'] = hashed_password
         
         # Update user in database
-        success = fb.update_user(username, {'password': hashed_password})
+        success = fb.update_user(user['username'], {'password': hashed_password})
         
         if success:
             # Invalidate OTP
             otp_service.invalidate_otp(username)
+            if user.get('email'):
+                otp_service.send_password_changed_email(user['email'], user['username'])
             return jsonify({'success': True, 'message': 'Password reset successful. You can now login with your new password.'})
         else:
             return jsonify({'success': False, 'message': 'Failed to update password. Please try again.'}), 500
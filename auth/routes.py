@@ -1,14 +1,17 @@
 import uuid
-from flask import Blueprint, jsonify, request, make_response, render_template, flash, redirect, url_for
+from flask import Blueprint, jsonify, request, make_response, render_template, flash, redirect, url_for, current_app
 from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
 
 import firebase_service as fb
-from utils import get_current_user
+import rate_limit
+import session_tokens
+from utils import get_current_user, get_current_account, set_current_user, save_session, end_session, signed_sessions
 
 auth_bp = Blueprint('auth', __name__)
 
 @auth_bp.route('/login', methods=['POST'])
+@rate_limit.throttle('login', status='error')
 def login():
     data = request.get_json()
     username = data.get('username')
@@ -16,7 +19,8 @@ def login():
 
     user = fb.get_user(username)
 
-    if user and check_password_hash(user.get('password'), password):
+    # Imported accounts have no password until one is set through the reset flow
+    if user and user.get('password') and password and check_password_hash(user['password'], password):
         # Create session
         session_id = str(uuid.uuid4())
         session_data = {
@@ -31,12 +35,12 @@ def login():
             "timestamp": datetime.now().isoformat()
         }
         
-        fb.create_session(session_data)
+        cookie_value = save_session(session_data, user.get('session_generation', 0))
 
         # Determine redirect based on role
         redirect_url = url_for('cr.dashboard') if user.get('role') == 'cr' else url_for('features.notes')
         res = make_response(jsonify({"status": "success", "message": "Login successful", "user": session_data, "redirect": redirect_url}))
-        res.set_cookie('session_id', session_id, httponly=True, max_age=3600*24*7) # 1 week
+        res.set_cookie('session_id', cookie_value, httponly=True, max_age=current_app.config['SESSION_MAX_AGE'])
         return res
     
     return jsonify({"status": "error", "message": "Invalid username or password"}), 401
@@ -45,12 +49,32 @@ def login():
 def logout():
     session_id = request.cookies.get('session_id')
     if session_id:
-        fb.delete_session(session_id)
+        user = get_current_user()
+        end_session(session_id, user['username'] if user else None)
+    set_current_user(None)
     
     res = make_response(jsonify({"status": "success", "message": "Logged out"}))
     res.set_cookie('session_id', '', expires=0)
     return res
 
+@auth_bp.route('/logout-all', methods=['POST'])
+def logout_all():
+    user = get_current_user()
+    if not user:
+        return jsonify({"status": "error", "message": "Invalid session"}), 401
+
+    if signed_sessions():
+        session_tokens.revoke_all(user['username'])
+        message = "Logged out of all sessions"
+    else:
+        count = fb.delete_user_sessions(user['username'])
+        message = f"Logged out of {count} session(s)"
+    set_current_user(None)
+
+    res = make_response(jsonify({"status": "success", "message": message}))
+    res.set_cookie('session_id', '', expires=0)
+    return res
+
 @auth_bp.route('/session', methods=['GET'])
 def get_session():
     session = get_current_user()
@@ -64,7 +88,7 @@ def settings():
     if not session_user:
         return redirect(url_for('index'))
 
-    user = fb.get_user(session_user['username'])
+    user = get_current_account()
     if not user:
         return redirect(url_for('auth.logout'))
 
@@ -78,11 +102,18 @@ def settings():
 
         # Profile Pic Upload Disabled due to Storage Migration
         
-        if email: user['email'] = email
-        if mobile: user['mobile'] = mobile
+        old_email = user.get('email')
+        if email and fb.normalize_email(email) != fb.normalize_email(old_email):
+            owner = fb.get_username_for_email(email)
+            if owner and owner != user['username']:
+                flash("That email is already used by another account.", "error")
+                return redirect(url_for('auth.settings'))
+
+        changes = {}
+        if email: changes['email'] = email
+        if mobile: changes['mobile'] = mobile
 
         # Password Change
-        pw_changed = False
         if new_pw:
             if not current_pw:
                 flash("Enter current password to set a new one.", "error")
@@ -93,22 +124,35 @@ def settings():
             elif len(new_pw) < 6:
                 flash("Password must be at least 6 characters.", "error")
             else:
-                user['password'] = generate_password_hash(new_pw)
-                pw_changed = True
+                changes['password'] = generate_password_hash(new_pw)
                 flash("Password updated successfully.", "success")
-        
-        if not new_pw or (new_pw and pw_changed):
-             if not new_pw: flash("Profile updated successfully.", "success")
-        
-        # Save to Firestore
-        fb.update_user(user['username'], user)
 
-        # Update Session in Firestore
-        session_user['email'] = user.get('email')
-        session_user['mobile'] = user.get('mobile')
-        session_user['profile_pic'] = user.get('profile_pic')
-        fb.create_session(session_user)
+        # Only write what the form actually changed. Sessions copy some profile
+        # fields (signed tokens none), so only fields the session has are synced.
+        changes = fb.changed_fields(user, changes)
+        profile = {
+            'email': changes.get('email', user.get('email')),
+            'mobile': changes.get('mobile', user.get('mobile')),
+            'profile_pic': user.get('profile_pic'),
+        }
+        session_changes = fb.changed_fields(session_user, {k: v for k, v in profile.items() if k in session_user})
+
+        if not new_pw:
+            flash("Profile updated successfully." if changes else "No changes to save.", "success")
 
-        return redirect(url_for('auth.settings'))
+        res = redirect(url_for('auth.settings'))
+        if not changes and not session_changes:
+            return res
+
+        # User fields and the Firestore session go in one batch; signed cookies are reissued below
+        fb.update_user(user['username'], changes, old_email=old_email,
+                       session=None if signed_sessions() else (session_user['session_id'], session_changes))
+        session_user.update(session_changes)
+        set_current_user(session_user)
+
+        if signed_sessions() and session_changes:
+            cookie_value = save_session(session_user, user.get('session_generation', 0))
+            res.set_cookie('session_id', cookie_value, httponly=True, max_age=current_app.config['SESSION_MAX_AGE'])
+        return res
 
     return render_template('settings.html', user=user)
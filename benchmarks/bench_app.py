@@ -0,0 +1,234 @@
+"""
+End-to-end benchmark of the Flask app against the in-memory Firestore.
+
+Seeds sections of students, a CR, announcements, notes and contacts into
+benchmarks/fake_firestore.py, then drives the app through Flask's test
+client: login, student page views, the CR dashboard, CR posts and the
+password-reset flow. For every scenario it reports throughput, latency
+percentiles, and Firestore round trips / documents read per request, so
+a regression shows up without network access.
+
+    python benchmarks/bench_app.py [--sections 4] [--items 200] [--requests 200]
+                                   [--latency-ms 0] [--cold] [--json out.json]
+
+--latency-ms adds a simulated network delay to every Firestore round trip;
+--cold clears the in-process caches before each request.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from werkzeug.security import generate_password_hash
+
+import firebase_service as fb
+import mailer
+import otp_service
+from fake_firestore import FakeFirestore, module
+
+PASSWORD = 'bench-password'
+
+
+class NullMailer(mailer.Mailer):
+    """Renders and "sends" inline without any SMTP server."""
+
+    def __init__(self):
+        super().__init__('localhost', 0, username='noreply@example.com', send_async=False)
+
+    def _send(self, msg):
+        pass
+
+
+def seed(client, sections, items, students):
+    """Fill the fake datastore; returns {section: {'cr': name, 'students': [names]}}."""
+    password = generate_password_hash(PASSWORD)
+    layout = {}
+    batch = client.batch()
+
+    def put(ref, data):
+        nonlocal batch
+        batch.set(ref, data)
+        if len(batch) >= fb.BATCH_LIMIT:
+            batch.commit()
+            batch = client.batch()
+
+    for s in range(sections):
+        section = chr(ord('A') + s)
+        names = [f'student_{section}{i:03d}' for i in range(students)]
+        layout[section] = {'cr': f'cr_{section}', 'students': names}
+        for username, role in [(f'cr_{section}', 'cr')] + [(name, 'student') for name in names]:
+            email = f'{username}@example.com'
+            put(client.collection('users').document(username),
+                {'username': username, 'email': email, 'password': password, 'role': role,
+                 'section': section, 'branch': 'CSE', 'mobile': '9999999999'})
+            put(client.collection(fb.EMAIL_INDEX).document(email), {'username': username})
+        for i in range(items):
+            date = f'2026-{1 + i % 12:02d}-{1 + i % 28:02d}'
+            stamp = int(time.time() * 1000) - i
+            put(client.collection('announcements').document(),
+                {'title': f'Announcement {i}', 'subtitle': 'Announcement', 'type': 'announcement',
+                 'description': 'Sessional exam schedule updated. ' * 4, 'date': date,
+                 'section': section, 'created_by': f'cr_{section}', 'updated_at': stamp})
+            put(client.collection('notes').document(),
+                {'subject': f'Subject {i % 8}', 'semester': str(1 + i % 8), 'download_url': 'https://example.com/n',
+                 'filename': 'Drive Link', 'original_name': 'External Resource', 'date': date,
+                 'section': section, 'uploaded_by': f'cr_{section}', 'updated_at': stamp})
+        for i in range(min(items, 20)):
+            put(client.collection('contacts').document(),
+                {'name': f'Contact {i}', 'role': 'Proctor', 'phone': '0110000000', 'section': section,
+                 'created_by': f'cr_{section}', 'updated_at': int(time.time() * 1000)})
+    batch.commit()
+    return layout
+
+
+def login(app, username):
+    c = app.test_client()
+    res = c.post('/auth/login', json={'username': username, 'password': PASSWORD})
+    assert res.status_code == 200, f'login failed for {username}: {res.status_code}'
+    return c
+
+
+def scenarios(app, layout):
+    """{name: callable() -> response} for every measured interaction."""
+    section = next(iter(layout))
+    students = [login(app, name) for name in layout[section]['students'][:8]]
+    cr = login(app, layout[section]['cr'])
+    anonymous = app.test_client()
+    reset_user = layout[section]['students'][-1]
+
+    etags = {}
+
+    def student_page(path):
+        return lambda: random.choice(students).get(path)
+
+    def revalidate(path):
+        def run():
+            c = students[0]
+            if path not in etags:
+                etags[path] = c.get(path).headers.get('ETag')
+            return c.get(path, headers={'If-None-Match': etags[path] or ''})
+        return run
+
+    def cr_post():
+        return cr.post('/cr/announcements', data={
+            'title': 'Benchmark notice', 'type': 'announcement',
+            'description': 'Posted by the benchmark.', 'date': time.strftime('%Y-%m-%d')})
+
+    # Only a hash of the OTP is stored, so remember the codes as they're generated
+    issued = []
+    generate_otp = otp_service.generate_otp
+    otp_service.generate_otp = lambda: issued.append(generate_otp()) or issued[-1]
+
+    def password_reset():
+        anonymous.post('/password-reset/request', json={'username': reset_user})
+        otp = issued.pop()
+        anonymous.post('/password-reset/verify', json={'username': reset_user, 'otp': otp})
+        return anonymous.post('/password-reset/reset', json={
+            'username': reset_user, 'new_password': PASSWORD, 'confirm_password': PASSWORD})
+
+    return {
+        'login': lambda: app.test_client().post('/auth/login', json={
+            'username': random.choice(layout[section]['students']), 'password': PASSWORD}),
+        'GET /notes': student_page('/notes'),
+        'GET /notes (304)': revalidate('/notes'),
+        'GET /announcements': student_page('/announcements'),
+        'GET /emergency-contacts': student_page('/emergency-contacts'),
+        'GET /api/v1/notes': student_page('/api/v1/notes?fields=subject,date'),
+        'GET /search': student_page('/search?q=exam+schedule'),
+        'GET /cr/dashboard': lambda: cr.get('/cr/dashboard'),
+        'POST /cr/announcements': cr_post,
+        'password reset flow': password_reset,
+    }
+
+
+def percentile(sorted_values, p):
+    index = min(int(round(p / 100 * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def measure(run, client, n, cold):
+    latencies = []
+    rpcs_before, reads_before = client.total_rpcs(), client.reads
+    statuses = set()
+    started = time.perf_counter()
+    for _ in range(n):
+        if cold:
+            fb.set_db(client)
+        t = time.perf_counter()
+        res = run()
+        latencies.append(time.perf_counter() - t)
+        statuses.add(res.status_code)
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'requests': n,
+        'rps': n / elapsed,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'rpcs_per_req': (client.total_rpcs() - rpcs_before) / n,
+        'reads_per_req': (client.reads - reads_before) / n,
+        'status': sorted(statuses),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sections', type=int, default=4)
+    parser.add_argument('--items', type=int, default=200, help='announcements and notes per section')
+    parser.add_argument('--students', type=int, default=60, help='students per section')
+    parser.add_argument('--requests', type=int, default=200, help='requests per scenario')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='simulated delay per Firestore round trip')
+    parser.add_argument('--cold', action='store_true', help='clear in-process caches before each request')
+    parser.add_argument('--only', help='run only scenarios whose name contains this text')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    os.environ.setdefault('FLASK_SECRET_KEY', 'benchmark')
+    client = FakeFirestore()
+    fb.set_db(client, module)
+    layout = seed(client, args.sections, args.items, args.students)
+    fb.rebuild_search_index()
+    fb.rebuild_section_digests()
+    mailer._mailer = NullMailer()
+
+    from app import app
+    app.config['TESTING'] = True
+    # Every scenario comes from one client IP; the limiter would turn most into 429s
+    app.config['RATE_LIMITING'] = False
+
+    results = {}
+    print(f"{args.sections} sections x {args.items} items, {args.requests} requests per scenario, "
+          f"{args.latency_ms:g} ms per round trip{', cold caches' if args.cold else ''}\n")
+    print(f"{'scenario':<26}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'rpcs':>7}{'reads':>8}  status")
+    # Route handlers print progress; keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        runs = scenarios(app, layout)
+    client.latency = args.latency_ms / 1000
+    for name, run in runs.items():
+        if args.only and args.only not in name:
+            continue
+        n = max(args.requests // 10, 5) if name in ('login', 'password reset flow') else args.requests
+        with contextlib.redirect_stdout(io.StringIO()):
+            run()  # warm-up
+            result = measure(run, client, n, args.cold)
+        results[name] = result
+        print(f"{name:<26}{result['rps']:>9.1f}{result['p50_ms']:>9.2f}{result['p95_ms']:>9.2f}"
+              f"{result['p99_ms']:>9.2f}{result['rpcs_per_req']:>7.1f}{result['reads_per_req']:>8.1f}  "
+              f"{','.join(map(str, result['status']))}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'args': vars(args), 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
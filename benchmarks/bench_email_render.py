@@ -0,0 +1,56 @@
+"""
+Micro-benchmark: cost of rendering one outbound email.
+
+Compares compiling the templates for every message (what a fresh Jinja
+environment per send would do) with the cached environment used by
+mailer.render_email, and the full EmailMessage build on top of it.
+
+    python benchmarks/bench_email_render.py [messages]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+import mailer
+
+CONTEXT = {
+    'otp': {'username': 'student01', 'otp': '482913', 'valid_minutes': 10},
+    'password_changed': {'username': 'student01', 'changed_at': '18 Oct 2026, 10:15 AM'},
+    'announcement_digest': {
+        'username': 'student01', 'section': 'A',
+        'announcements': [{'title': f'Notice {i}', 'date': '2026-10-18', 'type': 'announcement',
+                           'description': 'Sessional exam schedule updated.'} for i in range(10)],
+    },
+}
+
+
+def uncached(kind, **context):
+    env = Environment(loader=FileSystemLoader(mailer.TEMPLATE_DIR), autoescape=select_autoescape(['html']))
+    return (env.get_template(f'email/{kind}.html').render(**context),
+            env.get_template(f'email/{kind}.txt').render(**context))
+
+
+def per_message_us(func, n):
+    started = time.perf_counter()
+    for _ in range(n):
+        func()
+    return (time.perf_counter() - started) / n * 1e6
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    print(f"{'message':<22}{'compile/send':>16}{'cached render':>16}{'full message':>16}   (us per message, n={n})")
+    for kind, context in CONTEXT.items():
+        mailer.render_email(kind, **context)  # warm the cache
+        cold = per_message_us(lambda: uncached(kind, **context), max(n // 20, 10))
+        warm = per_message_us(lambda: mailer.render_email(kind, **context), n)
+        full = per_message_us(lambda: mailer.build_message(kind, 'student@example.com', 'noreply@example.com', **context), n)
+        print(f"{kind:<22}{cold:>16.1f}{warm:>16.1f}{full:>16.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,343 @@
+"""
+In-memory stand-in for the Firestore client, for benchmarks and offline runs.
+
+Implements the subset of google.cloud.firestore that firebase_service and
+otp_service use: collections and documents, where / order_by / start_after /
+limit / select queries, count() aggregations, get_all, batched writes and the
+Increment / ArrayUnion / ArrayRemove / DELETE_FIELD transforms. Every round trip is
+counted in `client.rpcs` and can be slowed down by `latency` seconds to
+imitate a real network.
+
+    import firebase_service as fb
+    from fake_firestore import FakeFirestore, module   # benchmarks/ on sys.path
+    fb.set_db(FakeFirestore(latency=0.02), module)
+"""
+import copy
+import threading
+import time
+import uuid
+from collections import Counter
+from types import SimpleNamespace
+
+
+# --- Field transforms (firestore.Increment etc.) ---
+class Increment:
+    def __init__(self, value):
+        self.value = value
+
+    def apply(self, current):
+        return (current if isinstance(current, (int, float)) else 0) + self.value
+
+
+class ArrayUnion:
+    def __init__(self, values):
+        self.values = list(values)
+
+    def apply(self, current):
+        result = list(current) if isinstance(current, list) else []
+        return result + [v for v in self.values if v not in result]
+
+
+class ArrayRemove:
+    def __init__(self, values):
+        self.values = list(values)
+
+    def apply(self, current):
+        return [v for v in (current if isinstance(current, list) else []) if v not in self.values]
+
+
+class Query:
+    ASCENDING = 'ASCENDING'
+    DESCENDING = 'DESCENDING'
+
+
+DELETE_FIELD = object()
+
+# Stands in for the `firestore` module firebase_service reads constants from
+class NotFound(KeyError):
+    """What google.api_core.exceptions.NotFound is to the real client: update() of a missing document."""
+
+
+module = SimpleNamespace(Query=Query, Increment=Increment, ArrayUnion=ArrayUnion,
+                         ArrayRemove=ArrayRemove, SERVER_TIMESTAMP=object(), DELETE_FIELD=DELETE_FIELD,
+                         NotFound=NotFound)
+
+
+def _resolve(data, existing=None):
+    """Apply transforms in `data` against `existing` field values."""
+    result = {}
+    for key, value in data.items():
+        if value is DELETE_FIELD:
+            continue
+        if hasattr(value, 'apply'):
+            value = value.apply((existing or {}).get(key))
+        elif isinstance(value, dict):
+            value = _resolve(value)
+        result[key] = copy.deepcopy(value)
+    return result
+
+
+def _merge(existing, data):
+    """set(merge=True): nested maps merge field by field, as in Firestore."""
+    merged = dict(existing)
+    for key, value in data.items():
+        if value is DELETE_FIELD:
+            merged.pop(key, None)
+        elif isinstance(value, dict) and isinstance(existing.get(key), dict):
+            merged[key] = _merge(existing[key], value)
+        else:
+            merged.update(_resolve({key: value}, existing))
+    return merged
+
+
+# --- Documents ---
+class Snapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field):
+        return (self._data or {}).get(field)
+
+
+class DocumentReference:
+    def __init__(self, client, collection, doc_id):
+        self._client = client
+        self._collection = collection
+        self.id = doc_id
+
+    @property
+    def _key(self):
+        return (self._collection, self.id)
+
+    @property
+    def parent(self):
+        return CollectionReference(self._client, self._collection)
+
+    def get(self):
+        self._client._rpc('get', reads=1)
+        with self._client._lock:
+            return Snapshot(self, copy.deepcopy(self._client._docs.get(self._key)))
+
+    def set(self, data, merge=False):
+        self._client._rpc('write')
+        with self._client._lock:
+            self._client._apply('set', self, data, merge)
+
+    def update(self, data):
+        self._client._rpc('write')
+        with self._client._lock:
+            self._client._apply('update', self, data)
+
+    def delete(self):
+        self._client._rpc('write')
+        with self._client._lock:
+            self._client._apply('delete', self)
+
+
+# --- Queries ---
+class AggregationResult:
+    def __init__(self, alias, value):
+        self.alias = alias
+        self.value = value
+
+
+class AggregationQuery:
+    def __init__(self, query, alias):
+        self._query = query
+        self._alias = alias
+
+    def get(self):
+        self._query._client._rpc('aggregate', reads=1)
+        return [[AggregationResult(self._alias, len(self._query._matches()))]]
+
+
+class FakeQuery:
+    _OPS = {
+        '==': lambda a, b: a == b,
+        '!=': lambda a, b: a != b,
+        '<': lambda a, b: a < b,
+        '<=': lambda a, b: a <= b,
+        '>': lambda a, b: a > b,
+        '>=': lambda a, b: a >= b,
+        'in': lambda a, b: a in b,
+        'array_contains': lambda a, b: isinstance(a, list) and b in a,
+    }
+
+    def __init__(self, client, collection, filters=(), orders=(), cursor=None, count=None, fields=None):
+        self._client = client
+        self._collection = collection
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._cursor = cursor
+        self._count = count
+        self._fields = fields
+
+    def _copy(self, **changes):
+        state = dict(filters=self._filters, orders=self._orders, cursor=self._cursor,
+                     count=self._count, fields=self._fields) | changes
+        return FakeQuery(self._client, self._collection, **state)
+
+    def where(self, field, op, value):
+        return self._copy(filters=self._filters + ((field, self._OPS[op], value),))
+
+    def order_by(self, field, direction=Query.ASCENDING):
+        return self._copy(orders=self._orders + ((field, direction),))
+
+    def start_after(self, values):
+        return self._copy(cursor=values)
+
+    def limit(self, count):
+        return self._copy(count=count)
+
+    def select(self, fields):
+        return self._copy(fields=list(fields))
+
+    def count(self, alias=None):
+        return AggregationQuery(self, alias)
+
+    @staticmethod
+    def _value(doc_id, data, field):
+        return doc_id if field == '__name__' else data.get(field)
+
+    def _after_cursor(self, doc_id, data):
+        # Lexicographic comparison over the orderings, honouring each direction
+        for field, direction in self._orders:
+            value, bound = self._value(doc_id, data, field), self._cursor.get(field)
+            if value == bound:
+                continue
+            return (value < bound) if direction == Query.DESCENDING else (value > bound)
+        return False
+
+    def _matches(self):
+        # Like Firestore, documents missing a filtered or ordered field never match
+        needed = {field for field, _, _ in self._filters} | {field for field, _ in self._orders}
+        needed.discard('__name__')
+        with self._client._lock:
+            docs = [(doc_id, copy.deepcopy(data)) for (collection, doc_id), data in self._client._docs.items()
+                    if collection == self._collection and needed <= data.keys()
+                    and all(op(self._value(doc_id, data, field), value) for field, op, value in self._filters)]
+        for field, direction in reversed(self._orders):
+            docs.sort(key=lambda d: self._value(d[0], d[1], field), reverse=direction == Query.DESCENDING)
+        if not self._orders:
+            docs.sort(key=lambda d: d[0])
+        if self._cursor is not None:
+            docs = [(doc_id, data) for doc_id, data in docs if self._after_cursor(doc_id, data)]
+        if self._count is not None:
+            docs = docs[:self._count]
+        return docs
+
+    def stream(self):
+        matches = self._matches()
+        self._client._rpc('query', reads=max(len(matches), 1))
+        for doc_id, data in matches:
+            if self._fields is not None:
+                data = {k: v for k, v in data.items() if k in self._fields}
+            yield Snapshot(DocumentReference(self._client, self._collection, doc_id), data)
+
+    def get(self):
+        return list(self.stream())
+
+
+class CollectionReference(FakeQuery):
+    def __init__(self, client, name):
+        super().__init__(client, name)
+        self.id = name
+
+    def document(self, doc_id=None):
+        return DocumentReference(self._client, self._collection, doc_id or uuid.uuid4().hex[:20])
+
+    def add(self, data):
+        ref = self.document()
+        ref.set(data)
+        return time.time(), ref
+
+
+# --- Batches ---
+class WriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._writes = []
+
+    def set(self, ref, data, merge=False):
+        self._writes.append(('set', ref, data, merge))
+
+    def update(self, ref, data):
+        self._writes.append(('update', ref, data, False))
+
+    def delete(self, ref):
+        self._writes.append(('delete', ref, None, False))
+
+    def __len__(self):
+        return len(self._writes)
+
+    def commit(self):
+        if len(self._writes) > 500:
+            raise ValueError('A batch can contain at most 500 writes')
+        self._client._rpc('commit')
+        with self._client._lock:
+            for op, ref, data, merge in self._writes:
+                self._client._apply(op, ref, data, merge)
+        self._writes = []
+
+
+# --- Client ---
+class FakeFirestore:
+    """Thread-safe in-memory Firestore client.
+
+    `rpcs` counts round trips by kind (get, query, aggregate, commit, write)
+    and `reads` the documents they billed; `latency` seconds are slept
+    before each round trip.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.rpcs = Counter()
+        self.reads = 0
+        self._docs = {}  # (collection, id) -> data
+        self._lock = threading.Lock()
+
+    def collection(self, name):
+        return CollectionReference(self, name)
+
+    def batch(self):
+        return WriteBatch(self)
+
+    def get_all(self, refs):
+        refs = list(refs)
+        self._rpc('get', reads=len(refs))
+        with self._lock:
+            snapshots = [Snapshot(ref, copy.deepcopy(self._docs.get(ref._key))) for ref in refs]
+        yield from snapshots
+
+    def _rpc(self, kind, reads=0):
+        with self._lock:
+            self.rpcs[kind] += 1
+            self.reads += reads
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _apply(self, op, ref, data=None, merge=False):
+        key = ref._key
+        existing = self._docs.get(key)
+        if op == 'delete':
+            self._docs.pop(key, None)
+        elif op == 'update':
+            if existing is None:
+                raise NotFound(f'No document to update: {key[0]}/{key[1]}')
+            self._docs[key] = existing | _resolve(data, existing)
+        elif merge and existing is not None:
+            self._docs[key] = _merge(existing, data)
+        else:
+            self._docs[key] = _resolve(data)
+
+    def total_rpcs(self):
+        return sum(self.rpcs.values())
@@ -0,0 +1,235 @@
+"""
+JMIConnect - Bulk import / export
+Parses CSV and JSON uploads row by row (the file is never loaded whole,
+except for a single top-level JSON array), validates each row the same
+way the CR forms do, and serialises section data back to CSV or JSON Lines
+for backups. Writing is left to firebase_service.import_content /
+import_users, which batch the rows.
+"""
+import csv
+import io
+import json
+import re
+from datetime import datetime
+
+KINDS = ('announcements', 'notes', 'contacts', 'users')
+MAX_ROWS = 5000
+MAX_ERRORS = 200  # reported; rows beyond this are still counted
+
+COLUMNS = {
+    'announcements': (('title', 'description'), ('type', 'date', 'link')),
+    'notes': (('subject', 'semester', 'download_url'), ('date',)),
+    'contacts': (('name', 'phone'), ('role',)),
+    'users': (('username', 'email'), ('mobile', 'branch')),
+}
+
+# Fields written to exports (users never include password hashes)
+EXPORT_FIELDS = {
+    'announcements': ('id', 'title', 'type', 'description', 'date', 'link', 'created_by'),
+    'notes': ('id', 'subject', 'semester', 'download_url', 'date', 'uploaded_by'),
+    'contacts': ('id', 'name', 'role', 'phone', 'created_by'),
+    'users': ('username', 'email', 'mobile', 'branch', 'role'),
+}
+
+ANNOUNCEMENT_TYPES = ('announcement', 'deadline')
+# Usernames are Realtime Database keys (chat threads), which can't contain . $ # [ ] /
+USERNAME = re.compile(r'^[A-Za-z0-9_-]{3,40}$')
+DATE = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+# What bytes that aren't UTF-8 decode to with errors='surrogateescape'
+UNDECODABLE = re.compile(r'[\udc80-\udcff]')
+
+
+class ImportErrors(list):
+    """(line, message) pairs, capped at MAX_ERRORS; `total` counts all of them."""
+
+    total = 0
+
+    def add(self, line, message):
+        self.total += 1
+        if len(self) < MAX_ERRORS:
+            self.append((line, message))
+
+
+# --- Parsing ---
+def read_rows(stream, filename, errors):
+    """Yield (line, row dict) from an uploaded CSV, JSON Lines or JSON array file.
+
+    Rows that aren't valid UTF-8 (e.g. a CSV saved by Excel in a legacy
+    encoding) are recorded in `errors` instead of being yielded.
+    """
+    for line, row in _parse_rows(stream, filename, errors):
+        if _undecodable(row):
+            errors.add(line, 'Not valid UTF-8 text (save the file as "CSV UTF-8")')
+        else:
+            yield line, row
+
+
+def _parse_rows(stream, filename, errors):
+    # Undecodable bytes become lone surrogates rather than aborting the upload midway
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', errors='surrogateescape', newline='')
+    if filename.lower().endswith('.csv'):
+        # Line 1 is the header
+        for line, row in enumerate(csv.DictReader(text), start=2):
+            yield line, {(k or '').strip().lower(): (v or '').strip() for k, v in row.items()}
+        return
+
+    first = text.read(1)
+    while first.isspace():
+        first = text.read(1)
+    if first == '[':
+        # A single JSON array can't be parsed incrementally without a streaming parser
+        try:
+            rows = json.loads(first + text.read())
+        except ValueError as e:
+            errors.add(1, f'Invalid JSON: {e}')
+            return
+        for line, row in enumerate(rows if isinstance(rows, list) else [], start=1):
+            yield line, row
+        return
+
+    for line, raw in enumerate(_prepend(first, text), start=1):
+        if not raw.strip():
+            continue
+        try:
+            yield line, json.loads(raw)
+        except ValueError as e:
+            errors.add(line, f'Invalid JSON: {e}')
+
+
+def _undecodable(row):
+    values = row.items() if isinstance(row, dict) else [(None, row)]
+    return any(isinstance(v, str) and UNDECODABLE.search(v) for pair in values for v in pair)
+
+
+def _prepend(first, text):
+    lines = iter(text)
+    yield first + next(lines, '')
+    yield from lines
+
+
+# --- Validation ---
+def clean_rows(kind, rows, section, created_by, errors):
+    """Yield (line, document) for every valid row; record the rest in `errors`."""
+    required, optional = COLUMNS[kind]
+    count = 0
+    for line, row in rows:
+        count += 1
+        if count > MAX_ROWS:
+            errors.add(line, f'Only the first {MAX_ROWS} rows are imported')
+            return
+        if not isinstance(row, dict):
+            errors.add(line, 'Row must be an object')
+            continue
+        values = {k: str(row.get(k) or '').strip() for k in required + optional}
+        missing = [k for k in required if not values[k]]
+        if missing:
+            errors.add(line, f"Missing {', '.join(missing)}")
+            continue
+        try:
+            doc = _BUILDERS[kind](values, section, created_by)
+        except ValueError as e:
+            errors.add(line, str(e))
+            continue
+        yield line, doc
+
+
+def _check_url(url, column):
+    if not url.startswith(('http://', 'https://')):
+        raise ValueError(f'{column} must start with http:// or https://')
+
+
+def _check_date(date):
+    if not DATE.match(date):
+        raise ValueError('date must be YYYY-MM-DD')
+
+
+def _announcement(v, section, created_by):
+    kind = (v['type'] or 'announcement').lower()
+    if kind not in ANNOUNCEMENT_TYPES:
+        raise ValueError(f"type must be one of {', '.join(ANNOUNCEMENT_TYPES)}")
+    if v['date']:
+        _check_date(v['date'])
+    doc = {
+        "title": v['title'],
+        "subtitle": kind.title(),
+        "description": v['description'],
+        "type": kind,
+        "date": v['date'] or datetime.now().strftime('%Y-%m-%d'),
+        "section": section,
+        "created_by": created_by,
+        "timestamp": datetime.now().isoformat(),
+    }
+    if v['link']:
+        _check_url(v['link'], 'link')
+        doc["link"] = v['link']
+        doc["link_text"] = "View Details"
+    return doc
+
+
+def _note(v, section, created_by):
+    _check_url(v['download_url'], 'download_url')
+    if v['date']:
+        _check_date(v['date'])
+    return {
+        "subject": v['subject'],
+        "semester": v['semester'],
+        "download_url": v['download_url'],
+        "filename": "Drive Link",
+        "original_name": "External Resource",
+        "uploaded_by": created_by,
+        "section": section,
+        "date": v['date'] or datetime.now().strftime('%Y-%m-%d'),
+        "timestamp": datetime.now().isoformat(),
+    }
+
+
+def _contact(v, section, created_by):
+    return {
+        "name": v['name'],
+        "role": v['role'],
+        "phone": v['phone'],
+        "section": section,
+        "created_by": created_by,
+    }
+
+
+def _user(v, section, created_by):
+    if not USERNAME.match(v['username']):
+        raise ValueError('username may only use letters, digits, _ - (3-40 characters)')
+    if '@' not in v['email']:
+        raise ValueError('email is not valid')
+    # No password: students set one with "Forgot password" (email OTP)
+    return {
+        "username": v['username'],
+        "email": v['email'],
+        "mobile": v['mobile'],
+        "branch": v['branch'],
+        "section": section,
+        "role": 'student',
+    }
+
+
+_BUILDERS = {'announcements': _announcement, 'notes': _note, 'contacts': _contact, 'users': _user}
+
+
+# --- Export ---
+def to_csv(kind, items):
+    """Yield CSV text (header first) for an iterable of documents."""
+    fields = EXPORT_FIELDS[kind]
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields, extrasaction='ignore')
+    writer.writeheader()
+    for item in items:
+        writer.writerow(item)
+        if buffer.tell() > 8192:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def to_ndjson(kind, items):
+    """Yield one JSON object per line for an iterable of documents."""
+    fields = EXPORT_FIELDS[kind]
+    for item in items:
+        yield json.dumps({k: item[k] for k in fields if k in item}, ensure_ascii=False, default=str) + '\n'
@@ -0,0 +1,149 @@
+"""
+JMIConnect - In-process caches
+Small thread-safe TTL + LRU cache used to avoid re-reading Firestore
+documents that rarely change. Each process (worker / serverless instance)
+holds its own copy, so entries are only as fresh as their TTL across
+instances; writes made through firebase_service invalidate locally.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import profiling
+
+
+class TTLCache:
+    """Bounded mapping whose entries expire after `ttl` seconds.
+
+    The least recently used entry is evicted once `maxsize` is reached.
+    With `stale_ttl`, get_or_load() keeps serving an expired entry for that
+    many extra seconds while it is reloaded in the background
+    (stale-while-revalidate). Named caches report hits and misses to the
+    request profile (see profiling).
+    """
+
+    def __init__(self, maxsize=1024, ttl=60, stale_ttl=0, name=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        # key -> (fresh_until, stale_until, value)
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        # Bumped by every invalidation so in-flight loads don't store stale data
+        self._epoch = 0
+
+    def _lookup(self, key, now):
+        entry = self._data.get(key)
+        if entry is not None and entry[1] < now:
+            del self._data[key]
+            return None
+        return entry
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._lookup(key, now)
+            if entry is None or entry[0] < now:
+                self.misses += 1
+                hit = False
+            else:
+                self._data.move_to_end(key)
+                self.hits += 1
+                hit = True
+        if self.name:
+            profiling.record_cache(self.name, hit)
+        return entry[2] if hit else default
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._store(key, value, ttl)
+
+    def _store(self, key, value, ttl=None):
+        fresh_until = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (fresh_until, fresh_until + self.stale_ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def _store_if_current(self, key, value, epoch):
+        with self._lock:
+            if epoch == self._epoch:
+                self._store(key, value)
+
+    def get_or_load(self, key, loader):
+        """Return the cached value for `key`, calling `loader()` to fill it."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._lookup(key, now)
+            epoch = self._epoch
+            if entry is not None:
+                self._data.move_to_end(key)
+                if entry[0] >= now:
+                    self.hits += 1
+                else:
+                    self.stale_hits += 1
+                    if key not in self._refreshing:
+                        self._refreshing.add(key)
+                        threading.Thread(target=self._refresh, args=(key, loader, epoch), daemon=True).start()
+            else:
+                self.misses += 1
+        if self.name:
+            profiling.record_cache(self.name, entry is not None)
+        if entry is not None:
+            return entry[2]
+
+        value = loader()
+        self._store_if_current(key, value, epoch)
+        return value
+
+    def _refresh(self, key, loader, epoch):
+        try:
+            self._store_if_current(key, loader(), epoch)
+        except Exception as e:
+            print(f"Cache refresh failed for {key}: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._epoch += 1
+            self._data.pop(key, None)
+
+    def invalidate_where(self, predicate):
+        """Drop every entry whose value matches `predicate(value)`."""
+        with self._lock:
+            self._epoch += 1
+            for key in [k for k, entry in self._data.items() if predicate(entry[2])]:
+                del self._data[key]
+
+    def invalidate_keys(self, predicate):
+        """Drop every entry whose key matches `predicate(key)`."""
+        with self._lock:
+            self._epoch += 1
+            for key in [k for k in self._data if predicate(k)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        total = self.hits + self.stale_hits + self.misses
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'hit_rate': round((self.hits + self.stale_hits) / total, 4) if total else 0.0,
+        }
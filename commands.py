@@ -0,0 +1,77 @@
+"""
+JMIConnect - Maintenance Commands
+One-off data jobs, run with the Flask CLI, e.g.
+    flask --app app backfill-email-index
+"""
+import click
+
+
+@click.command('backfill-email-index')
+def backfill_email_index():
+    """Build email_index entries for all existing users."""
+    import firebase_service as fb
+    count = fb.backfill_email_index()
+    click.echo(f"Indexed {count} user email(s).")
+
+
+@click.command('backfill-updated-at')
+def backfill_updated_at():
+    """Stamp announcements, notes and contacts that have no updated_at, for delta sync."""
+    import firebase_service as fb
+    count = fb.backfill_updated_at()
+    click.echo(f"Stamped {count} item(s).")
+
+
+@click.command('rebuild-chat-index')
+@click.option('--section', help="Only rebuild this section (default: every section with chat data).")
+def rebuild_chat_index(section):
+    """Regenerate chat threads and conversation summaries from the flat message feed."""
+    import firebase_service as fb
+    sections = [section] if section else fb.list_chat_sections()
+    for name in sections:
+        count = fb.rebuild_chat_index(name)
+        click.echo(f"Section {name}: {count} thread(s).")
+
+
+@click.command('rebuild-search-index')
+@click.option('--section', help="Only rebuild this section (default: every section).")
+def rebuild_search_index(section):
+    """Re-index every note and announcement for search."""
+    import firebase_service as fb
+    count = fb.rebuild_search_index(section)
+    click.echo(f"Indexed {count} search term(s).")
+
+
+@click.command('rebuild-section-digests')
+@click.option('--section', help="Only rebuild this section (default: every section with content).")
+def rebuild_section_digests(section):
+    """Regenerate the per-section digests student pages are served from."""
+    import firebase_service as fb
+    sections = fb.rebuild_section_digests(section)
+    click.echo(f"Rebuilt {len(sections)} section digest(s).")
+
+
+@click.command('purge-sessions')
+def purge_sessions():
+    """Delete expired login sessions."""
+    import firebase_service as fb
+    count = fb.purge_expired_sessions()
+    click.echo(f"Deleted {count} expired session(s).")
+
+
+@click.command('backfill-session-expiry')
+def backfill_session_expiry():
+    """Set expires_at on sessions created before it existed, so purge-sessions finds them."""
+    import firebase_service as fb
+    count = fb.backfill_session_expiry()
+    click.echo(f"Updated {count} session(s).")
+
+
+def register_commands(app):
+    app.cli.add_command(backfill_email_index)
+    app.cli.add_command(backfill_updated_at)
+    app.cli.add_command(rebuild_chat_index)
+    app.cli.add_command(rebuild_search_index)
+    app.cli.add_command(rebuild_section_digests)
+    app.cli.add_command(purge_sessions)
+    app.cli.add_command(backfill_session_expiry)
@@ -4,11 +4,39 @@ from flask import Flask
 class Config:
     SECRET_KEY = os.getenv("FLASK_SECRET_KEY", "dev-fallback-change-in-production")
     DEBUG = os.getenv("FLASK_DEBUG", "False").lower() == "true"
+    # "firestore" (server-side session documents) or "signed" (stateless signed cookie;
+    # logouts reach other instances within SESSION_TOKEN_REFRESH seconds, see session_tokens.py)
+    SESSION_MODE = os.getenv("SESSION_MODE", "firestore").lower()
+    SESSION_MAX_AGE = int(os.getenv("SESSION_MAX_AGE", 3600 * 24 * 7))
+    # Build the Firestore client at start-up instead of on first use
+    FIREBASE_EAGER_INIT = os.getenv("FIREBASE_EAGER_INIT", "False").lower() == "true"
+    # Part of every page ETag, so a deploy with changed templates re-renders cached pages
+    RELEASE = os.getenv("RELEASE") or os.getenv("VERCEL_GIT_COMMIT_SHA", "")
+    # Server-Timing headers, per-request log lines and /api/metrics (see profiling.py)
+    PROFILING = os.getenv("PROFILING", "False").lower() == "true"
+    # If set, /api/metrics requires "Authorization: Bearer <token>"
+    METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+    # Largest accepted request body (bulk import uploads)
+    MAX_CONTENT_LENGTH = int(os.getenv("MAX_UPLOAD_MB", 16)) * 1024 * 1024
+    # Login / OTP attempt limits (see rate_limit.py)
+    RATE_LIMITING = os.getenv("RATE_LIMITING", "True").lower() == "true"
+    # Reverse proxies in front of the app, so client IPs come from X-Forwarded-For (Vercel has one)
+    TRUSTED_PROXIES = int(os.getenv("TRUSTED_PROXIES", 1 if os.getenv("VERCEL") else 0))
 
 def create_app():
     app = Flask(__name__)
     app.config.from_object(Config)
 
+    if app.config['TRUSTED_PROXIES']:
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['TRUSTED_PROXIES'])
+
+    import profiling
+    profiling.init_app(app)
+
+    from utils import refresh_session_cookie
+    app.after_request(refresh_session_cookie)
+
     # register blueprints
     from auth.routes import auth_bp
     from api.routes import api_bp
@@ -18,4 +46,11 @@ def create_app():
     app.register_blueprint(api_bp, url_prefix='/api')
     app.register_blueprint(features_bp)
 
+    from commands import register_commands
+    register_commands(app)
+
+    if app.config['FIREBASE_EAGER_INIT']:
+        import firebase_service as fb
+        fb.warm_up()
+
     return app
\ No newline at end of file
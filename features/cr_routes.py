@@ -1,11 +1,12 @@
 from functools import wraps
-from flask import Blueprint, render_template, request, redirect, url_for, current_app, jsonify, flash
+from flask import Blueprint, render_template, request, redirect, url_for, current_app, jsonify, flash, Response, stream_with_context
 from werkzeug.utils import secure_filename
 from datetime import datetime
 import os
 
+import bulk_io
 import firebase_service as fb
-from utils import get_current_user
+from utils import get_current_user, get_current_account, get_page_or_400, render_paged, conditional, skip_etag
 
 cr_bp = Blueprint('cr', __name__, url_prefix='/cr')
 
@@ -17,7 +18,7 @@ def cr_required(f):
         if not user:
             return redirect(url_for('index'))
         
-        full_user = fb.get_user(user['username'])
+        full_user = get_current_account()
         
         if not full_user or full_user.get('role') != 'cr':
             return redirect(url_for('index'))
@@ -28,26 +29,24 @@ def cr_required(f):
 # ==================== DASHBOARD ====================
 @cr_bp.route('/dashboard')
 @cr_required
+@conditional(*fb.COUNTED)
 def dashboard():
     user = get_current_user()
     section = user.get('section')
     
-    # Get stats from Firebase
-    announcements_list = fb.get_announcements(section)
-    notes_list = fb.get_notes(section)
-    contacts_list = fb.get_contacts(section)
-    
-    stats = {
-        'announcements': len(announcements_list),
-        'notes': len(notes_list),
-        'contacts': len(contacts_list)
-    }
+    # Get stats from Firebase (aggregation counts, no documents downloaded)
+    stats = fb.get_section_counts(section)
+    if None in stats.values():
+        # Show the failed count as 0 this once, not for as long as the ETag holds
+        skip_etag()
+        stats = {kind: n or 0 for kind, n in stats.items()}
     
     return render_template('cr_panel/dashboard.html', user=user, stats=stats)
 
 # ==================== ANNOUNCEMENTS ====================
 @cr_bp.route('/announcements', methods=['GET', 'POST'])
 @cr_required
+@conditional('announcements')
 def announcements():
     user = get_current_user()
     section = user.get('section')
@@ -75,20 +74,24 @@ def announcements():
         flash("Announcement published successfully!", "success")
         return redirect(url_for('cr.announcements'))
 
-    # Fetch from Firebase
-    section_data = fb.get_announcements(section)
-    return render_template('cr_panel/announcements.html', user=user, announcements=section_data)
+    # Fetch the requested page from Firebase
+    section_data, next_cursor = get_page_or_400('announcements', section)
+    return render_paged('cr_panel/announcements.html', 'partials/cr_announcement_items.html', 'announcements',
+                        section_data, next_cursor, user=user)
 
 @cr_bp.route('/announcements/delete/<item_id>', methods=['POST'])
 @cr_required
 def delete_announcement(item_id):
-    fb.delete_announcement(item_id)
-    flash("Item deleted successfully.", "success")
+    if fb.delete_announcement(item_id, get_current_user().get('section')):
+        flash("Item deleted successfully.", "success")
+    else:
+        flash("That item was not found in your section.", "error")
     return redirect(url_for('cr.announcements'))
 
 # ==================== NOTES ====================
 @cr_bp.route('/notes', methods=['GET', 'POST'])
 @cr_required
+@conditional('notes')
 def notes():
     user = get_current_user()
     section = user.get('section')
@@ -122,21 +125,25 @@ def notes():
         flash("Note resource added successfully!", "success")
         return redirect(url_for('cr.notes'))
 
-    # Fetch from Firebase
-    section_data = fb.get_notes(section)
-    return render_template('cr_panel/notes.html', user=user, notes=section_data)
+    # Fetch the requested page from Firebase
+    section_data, next_cursor = get_page_or_400('notes', section)
+    return render_paged('cr_panel/notes.html', 'partials/cr_note_items.html', 'notes',
+                        section_data, next_cursor, user=user)
 
 @cr_bp.route('/notes/delete/<note_id>', methods=['POST'])
 @cr_required
 def delete_note(note_id):
     # Only delete metadata from Firestore
-    fb.delete_note(note_id)
-    flash("Resource removed successfully.", "success")
+    if fb.delete_note(note_id, get_current_user().get('section')):
+        flash("Resource removed successfully.", "success")
+    else:
+        flash("That resource was not found in your section.", "error")
     return redirect(url_for('cr.notes'))
 
 # ==================== CONTACTS ====================
 @cr_bp.route('/contacts', methods=['GET', 'POST'])
 @cr_required
+@conditional('contacts')
 def contacts():
     user = get_current_user()
     section = user.get('section')
@@ -159,10 +166,63 @@ def contacts():
 @cr_bp.route('/contacts/delete/<contact_id>', methods=['POST'])
 @cr_required
 def delete_contact(contact_id):
-    fb.delete_contact(contact_id)
-    flash("Contact removed successfully.", "success")
+    if fb.delete_contact(contact_id, get_current_user().get('section')):
+        flash("Contact removed successfully.", "success")
+    else:
+        flash("That contact was not found in your section.", "error")
     return redirect(url_for('cr.contacts'))
 
+# ==================== BULK IMPORT / EXPORT ====================
+@cr_bp.route('/import', methods=['GET', 'POST'])
+@cr_required
+def bulk_import():
+    user = get_current_user()
+    section = user.get('section')
+
+    if request.method == 'GET':
+        return render_template('cr_panel/import.html', user=user, kinds=bulk_io.KINDS, columns=bulk_io.COLUMNS)
+
+    kind = request.form.get('kind')
+    upload = request.files.get('file')
+    if kind not in bulk_io.KINDS or not upload or not upload.filename:
+        flash("Choose what to import and a CSV or JSON file.", "error")
+        return redirect(url_for('cr.bulk_import'))
+
+    errors = bulk_io.ImportErrors()
+    rows = bulk_io.clean_rows(kind, bulk_io.read_rows(upload.stream, upload.filename, errors),
+                              section, user['username'], errors)
+    if kind == 'users':
+        imported, conflicts = fb.import_users(rows)
+        for line, message in conflicts:
+            errors.add(line, message)
+    else:
+        imported = fb.import_content(kind, section, (doc for _, doc in rows))
+    errors.sort()
+
+    result = {"kind": kind, "imported": imported, "failed": errors.total, "errors": errors}
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify({"status": "success", **result})
+    return render_template('cr_panel/import.html', user=user, kinds=bulk_io.KINDS, columns=bulk_io.COLUMNS,
+                           result=result)
+
+@cr_bp.route('/export/<kind>')
+@cr_required
+def bulk_export(kind):
+    """Download a section's data as CSV (default) or JSON Lines (?format=ndjson)."""
+    if kind not in bulk_io.KINDS:
+        return redirect(url_for('cr.bulk_import'))
+    section = get_current_user().get('section')
+    fields = [f for f in bulk_io.EXPORT_FIELDS[kind] if f != 'id']
+    items = fb.iter_section(kind, section, fields)
+
+    if request.args.get('format') == 'ndjson':
+        body, mimetype, ext = bulk_io.to_ndjson(kind, items), 'application/x-ndjson', 'jsonl'
+    else:
+        body, mimetype, ext = bulk_io.to_csv(kind, items), 'text/csv', 'csv'
+    filename = f"{kind}-section-{section}-{datetime.now().strftime('%Y%m%d')}.{ext}"
+    return Response(stream_with_context(body), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
 # ==================== MESSAGES (Firebase-powered) ====================
 @cr_bp.route('/messages')
 @cr_required
@@ -178,3 +238,37 @@ def messages():
         pass
         
     return render_template('cr_panel/messages.html', user=user, firebase_config=firebase_config)
+
+
+# ==================== MESSAGES API ====================
+@cr_bp.route('/messages/threads')
+@cr_required
+def message_threads():
+    """Conversation list for the inbox, most recent first."""
+    user = get_current_user()
+    limit = min(max(request.args.get('limit', 100, type=int), 1), 200)
+    threads = fb.get_conversations(user.get('section'), limit=limit)
+    return jsonify({"status": "success", "threads": threads})
+
+@cr_bp.route('/messages/threads/<student>', methods=['GET', 'POST'])
+@cr_required
+def message_thread(student):
+    user = get_current_user()
+    section = user.get('section')
+
+    if request.method == 'POST':
+        text = ((request.get_json(silent=True) or {}).get('text') or '').strip()
+        if not text:
+            return jsonify({"status": "error", "message": "Message is empty"}), 400
+        msg = fb.post_chat_message(section, student, user['username'], 'cr', text)
+        if msg is None:
+            return jsonify({"status": "error", "message": "Chat is not available"}), 503
+        return jsonify({"status": "success", "message": msg})
+
+    # Pages go backwards in time: pass the oldest timestamp you have as ?before=
+    before = request.args.get('before', type=int)
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+    msgs, has_more = fb.get_thread_messages(section, student, limit=limit, before=before)
+    if before is None:
+        fb.mark_thread_read(section, student)
+    return jsonify({"status": "success", "messages": msgs, "has_more": has_more})
\ No newline at end of file
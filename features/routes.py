@@ -1,43 +1,61 @@
-from flask import Blueprint, render_template, request, redirect, url_for
+from flask import Blueprint, render_template, request, redirect, url_for, jsonify, abort
 
 import firebase_service as fb
-from utils import get_current_user
+from utils import get_current_user, get_page_or_400, render_paged, conditional
 
 features_bp = Blueprint('features', __name__)
 
 # ==================== NOTES (Student View) ====================
+NOTE_SEMESTERS = tuple(str(i) for i in range(1, 9))
+
 @features_bp.route('/notes')
+@conditional('notes')
 def notes():
     user = get_current_user()
     if not user:
         return redirect(url_for('index'))
     
     section = user.get('section')
-    # Fetch from Firebase
-    section_notes = fb.get_notes(section)
-    
-    # Group by semester for better organization
-    semesters = {}
-    for note in section_notes:
-        sem = note.get('semester', 'Unknown')
-        if sem not in semesters:
-            semesters[sem] = []
-        semesters[sem].append(note)
+    # Semester tabs filter in Firestore, so every page of a tab is that semester's
+    semester = request.args.get('semester') or None
+    if semester not in NOTE_SEMESTERS + (None,):
+        abort(400)
+    section_notes, next_cursor = get_page_or_400('notes', section, semester=semester)
             
-    return render_template("notes.html", user=user, notes=section_notes, semesters=semesters)
+    return render_paged("notes.html", "partials/note_cards.html", "notes", section_notes, next_cursor,
+                        user=user, semester=semester, semesters=NOTE_SEMESTERS)
 
 # ==================== ANNOUNCEMENTS (Student View) ====================
 @features_bp.route('/announcements')
+@conditional('announcements')
 def announcements():
     user = get_current_user()
     if not user:
         return redirect(url_for('index'))
     
     section = user.get('section')
-    # Fetch from Firebase
-    section_announcements = fb.get_announcements(section)
+    # Fetch the requested page from Firebase
+    section_announcements, next_cursor = get_page_or_400('announcements', section)
                 
-    return render_template("announcements.html", user=user, announcements=section_announcements)
+    return render_paged("announcements.html", "partials/announcement_cards.html", "announcements",
+                        section_announcements, next_cursor, user=user)
+
+# ==================== SEARCH (Student View) ====================
+@features_bp.route('/search')
+@conditional('notes', 'announcements')
+def search():
+    user = get_current_user()
+    if not user:
+        return redirect(url_for('index'))
+
+    query = request.args.get('q', '').strip()
+    page = max(request.args.get('page', 1, type=int), 1)
+    results, total = fb.search(user.get('section'), query, limit=fb.PAGE_SIZE, offset=(page - 1) * fb.PAGE_SIZE)
+
+    return render_template("search.html", user=user, query=query, page=page, total=total,
+                           has_next=page * fb.PAGE_SIZE < total,
+                           notes=[r for r in results if r['kind'] == 'notes'],
+                           announcements=[r for r in results if r['kind'] == 'announcements'])
 
 # ==================== CR CONNECT (Student View) ====================
 @features_bp.route('/cr-connect')
@@ -57,8 +75,24 @@ def cr_connect():
         
     return render_template("cr-connect.html", user=user, firebase_config=firebase_config)
 
+@features_bp.route('/cr-connect/messages', methods=['POST'])
+def cr_connect_send():
+    user = get_current_user()
+    if not user:
+        return jsonify({"status": "error", "message": "Invalid session"}), 401
+
+    text = ((request.get_json(silent=True) or {}).get('text') or '').strip()
+    if not text:
+        return jsonify({"status": "error", "message": "Message is empty"}), 400
+    msg = fb.post_chat_message(user.get('section'), user['username'], user['username'],
+                               user.get('role') or 'student', text)
+    if msg is None:
+        return jsonify({"status": "error", "message": "Chat is not available"}), 503
+    return jsonify({"status": "success", "message": msg})
+
 # ==================== EMERGENCY CONTACTS (Student View) ====================
 @features_bp.route('/emergency-contacts')
+@conditional('contacts')
 def emergency_contacts():
     user = get_current_user()
     if not user:
@@ -1,89 +1,693 @@
-import firebase_admin
-from firebase_admin import credentials, firestore
 import os
-from datetime import datetime
+import re
+import time
+import base64
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import contextvars
+
+import profiling
+import search_index
+from cache import TTLCache
 
 # Path to service account key
 SERVICE_ACCOUNT_KEY = 'serviceAccountKey.json'
 
 import json
 
+# The Firebase SDK is slow to import and the client slow to build, so both
+# happen on first datastore use (or an explicit warm_up()) rather than at
+# import time. Routes that never touch Firestore don't load firebase_admin.
+firestore = None  # firebase_admin.firestore, set by init_firebase()
+db = None
+_init_lock = threading.Lock()
+
+# Seconds spent in each start-up step of the last initialisation
+init_timings = {}
+
+def _database_url():
+    """Realtime Database URL (chat), from the environment or firebase_config.py."""
+    url = os.environ.get('FIREBASE_DATABASE_URL')
+    if not url:
+        try:
+            from firebase_config import FIREBASE_CONFIG
+            url = FIREBASE_CONFIG.get('databaseURL')
+        except (ImportError, ModuleNotFoundError):
+            pass
+    return url or None
+
+def _app_options():
+    url = _database_url()
+    return {'databaseURL': url} if url else None
+
 def init_firebase():
+    global firestore
+    init_timings.clear()
+    started = time.perf_counter()
+    import firebase_admin
+    from firebase_admin import credentials, firestore as firestore_module
+    firestore = firestore_module
+    init_timings['import_sdk'] = time.perf_counter() - started
+
+    step = time.perf_counter()
     if not firebase_admin._apps:
         # 1. Try file
         if os.path.exists(SERVICE_ACCOUNT_KEY):
             cred = credentials.Certificate(SERVICE_ACCOUNT_KEY)
-            firebase_admin.initialize_app(cred)
+            firebase_admin.initialize_app(cred, _app_options())
         # 2. Try Environment Variable (JSON String)
         elif os.environ.get('FIREBASE_SERVICE_ACCOUNT'):
             try:
                 service_account_info = json.loads(os.environ.get('FIREBASE_SERVICE_ACCOUNT'))
                 cred = credentials.Certificate(service_account_info)
-                firebase_admin.initialize_app(cred)
+                firebase_admin.initialize_app(cred, _app_options())
             except Exception as e:
                 print(f"Error initializing Firebase from env var: {e}")
                 return None
         # 3. Default (ADC)
         else:
             try:
-                firebase_admin.initialize_app()
+                firebase_admin.initialize_app(options=_app_options())
             except Exception as e:
                 print(f"Warning: Firebase initialization failed. {e}")
                 return None
-    return firestore.client()
+    init_timings['load_credentials'] = time.perf_counter() - step
 
-db = init_firebase()
+    step = time.perf_counter()
+    client = firestore.client()
+    init_timings['create_client'] = time.perf_counter() - step
+    init_timings['total'] = time.perf_counter() - started
+    print("Firebase initialised in {:.0f} ms ({})".format(
+        init_timings['total'] * 1000,
+        ', '.join(f"{k} {v * 1000:.0f} ms" for k, v in init_timings.items() if k != 'total')))
+    return client
 
 def get_db():
     global db
     if db is None:
-        db = init_firebase()
+        with _init_lock:
+            if db is None:
+                db = init_firebase()
     return db
 
-# --- Announcements ---
-def get_announcements(section=None):
+def _not_found():
+    """The exception update() of a missing document raises."""
+    if getattr(firestore, 'NotFound', None) is not None:
+        return firestore.NotFound  # fake_firestore
+    from google.api_core.exceptions import NotFound
+    return NotFound
+
+def set_db(client, firestore_module=None):
+    """Use `client` (e.g. benchmarks/fake_firestore.py) instead of initialising Firebase.
+
+    `firestore_module` supplies Query, Increment, ArrayUnion and ArrayRemove
+    for that client. Clears the in-process caches, which belong to the old one.
+    """
+    global db, firestore
+    with _init_lock:
+        db = client
+        if firestore_module is not None:
+            firestore = firestore_module
+    for cache in (content_cache, count_cache, version_cache, session_cache, search_cache):
+        cache.clear()
+
+def warm_up():
+    """Build the Firestore client now instead of on the first request that needs it."""
+    return get_db() is not None
+
+# --- Concurrency ---
+# Shared pool for running independent Firestore reads of one request in
+# parallel, so the request waits for the slowest read instead of the sum.
+_executor = ThreadPoolExecutor(max_workers=int(os.environ.get('FIRESTORE_WORKERS', 16)),
+                               thread_name_prefix='firestore')
+FANOUT_TIMEOUT = float(os.environ.get('FIRESTORE_FANOUT_TIMEOUT', 10))
+
+def fan_out(*calls, timeout=None, default=None):
+    """Run zero-argument callables concurrently and return their results in order.
+
+    A call that raises, or is still running `timeout` seconds after the
+    batch started, yields `default` without affecting the others.
+    Don't nest fan_out() calls inside the callables (they share the pool).
+    """
+    # Each call runs in a copy of the caller's context so it is profiled with its request
+    futures = [_executor.submit(contextvars.copy_context().run, call) for call in calls]
+    deadline = time.monotonic() + (FANOUT_TIMEOUT if timeout is None else timeout)
+    results = []
+    for future in futures:
+        try:
+            results.append(future.result(timeout=max(deadline - time.monotonic(), 0)))
+        except Exception as e:
+            print(f"Parallel Firestore read failed: {e!r}")
+            results.append(default)
+    return results
+
+def _stream(query):
+    """Run a query and return its documents, counting the reads."""
+    docs = list(query.stream())
+    profiling.record_reads(len(docs) or 1)  # an empty result still bills one read
+    return docs
+
+def _get(ref):
+    """Fetch one document snapshot, counting the read."""
+    doc = ref.get()
+    profiling.record_reads(1)
+    return doc
+
+# --- Section content cache ---
+# Announcements, notes and contacts change only when a CR posts or deletes,
+# but every student page view reads them. Section entries are keyed by the
+# content version they were loaded at (see Content versions), the same version
+# the page ETag is built from, so a body never lags behind its ETag: a
+# version bump seen by this instance misses the cache and reloads. Local
+# writes also invalidate their kind's entries right away.
+content_cache = TTLCache(
+    name='content',
+    maxsize=int(os.environ.get('CONTENT_CACHE_SIZE', 512)),
+    ttl=int(os.environ.get('CONTENT_CACHE_TTL', 120)),
+    stale_ttl=int(os.environ.get('CONTENT_CACHE_STALE_TTL', 600)),
+)
+
+def _cached_list(kind, section, loader):
+    return list(content_cache.get_or_load((kind, section), lambda: loader(section)))
+
+def invalidate_section(kind, section=None):
+    """Forget cached `kind` items for a section (all sections if unknown)."""
+    if section:
+        content_cache.invalidate_keys(lambda key: key[0] == kind and key[1] in (section, None))
+    else:
+        content_cache.invalidate_keys(lambda key: key[0] == kind)
+
+# --- Pagination ---
+# Pages are ordered by (date desc, document id desc) within a section (and
+# semester, for notes), which needs the composite indexes in
+# firestore.indexes.json.
+PAGE_SIZE = int(os.environ.get('PAGE_SIZE', 20))
+
+def encode_cursor(item):
+    raw = json.dumps([item.get('date', ''), item['id']]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Turn an opaque cursor back into (date, id). Raises ValueError if malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        date, doc_id = json.loads(raw)
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if not isinstance(date, str) or not isinstance(doc_id, str):
+        raise ValueError('Invalid cursor')
+    return date, doc_id
+
+@profiling.traced
+def _load_page(kind, section, limit, cursor, fields=None, semester=None):
+    client = get_db()
+    if client is None: return [], None
+
+    query = client.collection(kind)
+    if section:
+        query = query.where('section', '==', section)
+    if semester:
+        query = query.where('semester', '==', semester)
+    query = (query.order_by('date', direction=firestore.Query.DESCENDING)
+                  .order_by('__name__', direction=firestore.Query.DESCENDING))
+    if cursor:
+        date, doc_id = decode_cursor(cursor)
+        query = query.start_after({'date': date, '__name__': doc_id})
+    if fields:
+        # Only download the requested fields (and the one the cursor needs)
+        query = query.select(sorted(set(fields) | {'date'}))
+
+    # Fetch one extra document to know whether another page exists
+    docs = _stream(query.limit(limit + 1))
+    items = [doc.to_dict() | {'id': doc.id} for doc in docs[:limit]]
+    next_cursor = encode_cursor(items[-1]) if len(docs) > limit else None
+    return items, next_cursor
+
+def get_page(kind, section, limit=None, cursor=None, fields=None, semester=None):
+    """One page of `kind` ('announcements' or 'notes') for a section.
+
+    Returns (items, next_cursor); next_cursor is None on the last page.
+    `semester` keeps only notes of that semester. The first page is served
+    from the content cache (and projected to `fields` in memory); later
+    pages only fetch `fields` from Firestore.
+    """
+    limit = limit or PAGE_SIZE
+    if cursor:
+        items, next_cursor = _load_page(kind, section, limit, cursor, fields, semester)
+    elif section and limit == PAGE_SIZE and not semester:
+        # The default first page is part of the section digest
+        part = _digest_part(kind, section)
+        items, next_cursor = part['items'], part['next_cursor']
+    else:
+        items, next_cursor = content_cache.get_or_load(
+            (kind, section, 'page', limit, semester, content_version(kind, section)),
+            lambda: _load_page(kind, section, limit, None, semester=semester))
+    return project(list(items), fields), next_cursor
+
+# --- Section digest ---
+# Student pages show the first page of announcements and notes and every
+# contact. section_digests/<section> holds all three, so one document read
+# (cached) serves them. Each content write removes its kind from the digest
+# in the same batch and rebuilds it right after; a part that is missing
+# (never built, or its rebuild failed) is read from its collection instead
+# until the next write or `flask rebuild-section-digests`. Each part records
+# the content version it was built at, so a rebuild that lands after a newer
+# write's (overlapping CR writes) is ignored like a missing part.
+SECTION_DIGESTS = 'section_digests'
+DIGEST_KINDS = ('announcements', 'notes', 'contacts')
+
+def _build_digest_part(kind, section):
+    if kind == 'contacts':
+        return {'items': _load_contacts(section)}
+    items, next_cursor = _load_page(kind, section, PAGE_SIZE, None)
+    return {'items': items, 'next_cursor': next_cursor}
+
+@profiling.traced
+def _load_digest(section):
+    client = get_db()
+    if client is None: return {}
+    doc = _get(client.collection(SECTION_DIGESTS).document(section))
+    return (doc.to_dict() or {}) if doc.exists else {}
+
+def _digest_part(kind, section):
+    versions = tuple(content_version(k, section) for k in DIGEST_KINDS)
+    digest = content_cache.get_or_load(('digest', section, versions), lambda: _load_digest(section))
+    part = digest.get(kind)
+    if part is not None and part.get('version') == versions[DIGEST_KINDS.index(kind)]:
+        return part
+    return content_cache.get_or_load((kind, section, 'digest', versions[DIGEST_KINDS.index(kind)]),
+                                     lambda: _build_digest_part(kind, section))
+
+@profiling.traced
+def refresh_digest(section, kinds=DIGEST_KINDS):
+    """Rebuild `kinds` parts of a section's digest from their collections."""
+    client = get_db()
+    if client is None or not section: return False
+
+    # Versions are read before the content, so a part is never labelled newer than its items
+    version_cache.invalidate(section)
+    versions = get_content_versions(section)
+    parts = fan_out(*[lambda kind=kind: _build_digest_part(kind, section) for kind in kinds])
+    built = {kind: part | {'version': versions[kind][0]} for kind, part in zip(kinds, parts) if part is not None}
+    if built:
+        # update() replaces each part; set(merge=True) would merge into the old one
+        ref = client.collection(SECTION_DIGESTS).document(section)
+        try:
+            ref.update(built | {'built_at': int(time.time() * 1000)})
+        except _not_found():
+            ref.set(built | {'built_at': int(time.time() * 1000)}, merge=True)
+    content_cache.invalidate_keys(lambda key: key[:2] == ('digest', section))
+    return len(built) == len(kinds)
+
+@profiling.traced
+def rebuild_section_digests(section=None):
+    """Rebuild the digest of one section, or of every section with content. Returns the sections rebuilt."""
     client = get_db()
     if client is None: return []
-    
-    query = client.collection('announcements')
+
+    if section:
+        sections = {section}
+    else:
+        sections = {(doc.to_dict() or {}).get('section')
+                    for kind in DIGEST_KINDS for doc in client.collection(kind).select(['section']).stream()}
+        sections.discard(None)
+    for name in sorted(sections):
+        client.collection(SECTION_DIGESTS).document(name).delete()
+        refresh_digest(name)
+    return sorted(sections)
+
+# --- Counts ---
+# Dashboard stats use aggregation queries (one RPC each, no documents
+# downloaded). Like the content cache, counts are keyed by content version,
+# so a write (on any instance) is reflected as soon as the ETag changes. A
+# write therefore costs one recount of its kind rather than an in-place +1/-1:
+# a local adjustment can't account for writes made on other instances.
+COUNTED = ('announcements', 'notes', 'contacts')
+count_cache = TTLCache(name='counts', maxsize=512, ttl=int(os.environ.get('COUNT_CACHE_TTL', 600)))
+
+@profiling.traced
+def _count(kind, section):
+    client = get_db()
+    if client is None: return 0
+
+    query = client.collection(kind)
     if section:
         query = query.where('section', '==', section)
-    
-    docs = query.stream()
-    res = [doc.to_dict() | {'id': doc.id} for doc in docs]
-    # Sort in memory to avoid needing a composite index
-    res.sort(key=lambda x: x.get('date', ''), reverse=True)
-    return res
+    result = query.count(alias='total').get()
+    profiling.record_reads(1)
+    return int(result[0][0].value)
+
+def get_section_counts(section):
+    """Number of announcements, notes and contacts in a section.
+
+    A count that failed or timed out is None (and retried on the next call).
+    """
+    keys = {kind: (kind, section, content_version(kind, section)) for kind in COUNTED}
+    counts = {kind: count_cache.get(key) for kind, key in keys.items()}
+    missing = [kind for kind, n in counts.items() if n is None]
+    results = fan_out(*[lambda kind=kind: _count(kind, section) for kind in missing])
+    for kind, n in zip(missing, results):
+        counts[kind] = n
+        if n is not None:
+            count_cache.set(keys[kind], n)
+    return counts
+
+def _invalidate_counts(kind):
+    count_cache.invalidate_keys(lambda key: key[0] == kind)
+
+# --- Content versions ---
+# content_versions/<section> holds a counter (and last-change time) per
+# collection, bumped in the same batch as every add / delete. Pages derive
+# their ETag from it, so an unchanged page is revalidated without reading or
+# rendering the content. Other instances see a bump within CONTENT_VERSION_TTL.
+CONTENT_VERSIONS = 'content_versions'
+version_cache = TTLCache(name='versions', maxsize=1024, ttl=int(os.environ.get('CONTENT_VERSION_TTL', 15)))
 
+@profiling.traced
+def get_content_versions(section):
+    """{kind: (version, updated_at)} for a section's announcements, notes and contacts."""
+    versions = version_cache.get(section)
+    if versions is None:
+        client = get_db()
+        if client is None: return {kind: (0, None) for kind in COUNTED}
+
+        doc = _get(client.collection(CONTENT_VERSIONS).document(section))
+        data = (doc.to_dict() or {}) if doc.exists else {}
+        versions = {kind: (data.get(kind, 0), data.get(f'{kind}_updated_at')) for kind in COUNTED}
+        version_cache.set(section, versions)
+    return versions
+
+def content_version(kind, section):
+    """The version of a section's `kind` (None without a section); see get_content_versions."""
+    return get_content_versions(section)[kind][0] if section else None
+
+def _version_bump(client, kind, section):
+    """(ref, data) that bumps a section's `kind` version; write it with merge=True."""
+    return (client.collection(CONTENT_VERSIONS).document(section),
+            {kind: firestore.Increment(1), f'{kind}_updated_at': int(time.time())})
+
+@profiling.traced
+def _write_content(client, kind, op, ref, data=None, section=None):
+    """Add or delete one `kind` document, bumping its section's version and
+    updating the search index in the same batch.
+
+    A delete with a `section` only removes a document of that section.
+    Returns False (and writes nothing) if there is nothing to delete.
+    """
+    if op == 'delete':
+        # Deletes need the section, and the indexed text, from the document itself
+        doc = _get(ref)
+        data = doc.to_dict() if doc.exists else None
+        if data is None or (section and data.get('section') != section):
+            return False
+        section = data.get('section')
+
+    batch = client.batch()
+    now_ms = int(time.time() * 1000)
+    terms = {}
+    if data and section and kind in search_index.INDEXED:
+        terms = search_index.terms_for(kind, data)
+        key = search_index.posting_key(kind, ref.id)
+        for _, term_ref, term_data in _index_writes(client, section, {
+                token: {key: firestore.DELETE_FIELD if op == 'delete' else weight} for token, weight in terms.items()}):
+            batch.set(term_ref, term_data, merge=True)
+    if op == 'delete':
+        batch.delete(ref)
+        if section:
+            # Lets delta sync clients (get_changes) learn about the removal
+            batch.set(client.collection(TOMBSTONES).document(f'{kind}_{ref.id}'),
+                      {'kind': kind, 'section': section, 'id': ref.id, 'deleted_at': now_ms,
+                       'expire_at': datetime.fromtimestamp(now_ms / 1000 + TOMBSTONE_TTL, tz=timezone.utc)})
+    else:
+        batch.set(ref, data | {'updated_at': now_ms})
+    if section:
+        batch.set(*_version_bump(client, kind, section), merge=True)
+        # Never leave the digest stale, even if the rebuild below fails
+        batch.set(client.collection(SECTION_DIGESTS).document(section), {kind: firestore.DELETE_FIELD}, merge=True)
+    batch.commit()
+    version_cache.invalidate(section)
+    invalidate_section(kind, section)
+    if section:
+        refresh_digest(section, (kind,))
+    if terms:
+        invalidate_search(section, terms)
+    _invalidate_counts(kind)
+    return True
+
+# --- Field projection and delta sync (JSON API) ---
+# Items carry `updated_at` (epoch ms, set on write) and deletions leave a
+# tombstone, so clients can fetch only what changed since their last sync.
+# Changes are paged by (updated_at, id) and tombstones by (deleted_at, id),
+# so entries sharing a stamp (a bulk import) are never split across a page
+# boundary and lost. Sync tokens are opaque: [updated_at, id of the last item
+# returned, deleted_at, id of the last tombstone returned].
+# Tombstones carry `expire_at` for a Firestore TTL policy, so a token older
+# than TOMBSTONE_TTL is refused and the client has to list again.
+# Items written before updated_at existed need `flask backfill-updated-at`.
+# Needs the (section, updated_at) and tombstone indexes in firestore.indexes.json.
+TOMBSTONES = 'tombstones'
+TOMBSTONE_TTL = int(os.environ.get('TOMBSTONE_TTL', 3600 * 24 * 30))
+# A token handed out with a listing starts this far back, so writes still
+# committing (or not yet visible through the version cache) are resent
+# rather than missed; clients apply changes idempotently.
+SYNC_MARGIN_MS = 60_000
+
+def project(items, fields):
+    """Keep only `fields` (plus id) of each item; all fields when `fields` is empty."""
+    if not fields:
+        return items
+    keep = set(fields) | {'id'}
+    return [{k: v for k, v in item.items() if k in keep} for item in items]
+
+class SyncTokenExpired(ValueError):
+    """The tombstones a sync token needs may have expired; list again."""
+
+def encode_sync_token(updated_at, doc_id, deleted_at, tombstone_id=None):
+    raw = json.dumps([updated_at, doc_id, deleted_at, tombstone_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_sync_token(token):
+    """(updated_at, doc_id, deleted_at, tombstone_id) of a sync token (ids may be
+    None); a bare epoch ms and the 3-element form are accepted too. Raises
+    ValueError if malformed."""
+    if token.isdigit():
+        return int(token), None, int(token), None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        updated_at, doc_id, deleted_at, *rest = json.loads(raw)
+        (tombstone_id,) = rest or [None]
+    except Exception:
+        raise ValueError('Invalid sync token')
+    if not (isinstance(updated_at, int) and isinstance(deleted_at, int)
+            and all(i is None or isinstance(i, str) and i for i in (doc_id, tombstone_id))):
+        raise ValueError('Invalid sync token')
+    return updated_at, doc_id, deleted_at, tombstone_id
+
+def listing_sync_token():
+    """The token to start syncing from after listing a section's items now."""
+    start = int(time.time() * 1000) - version_cache.ttl * 1000 - SYNC_MARGIN_MS
+    return encode_sync_token(start, None, start)
+
+@profiling.traced
+def get_changes(kind, section, since, limit=None, fields=None):
+    """`kind` items written after the sync token `since` and tombstones of deletions after it.
+
+    Returns (items, deleted, has_more, token), oldest change first, with up
+    to `limit` of each; each deleted entry is {'id', 'deleted_at'}. Ask
+    again with `token` (right away while has_more is set). Raises
+    ValueError for a malformed token and SyncTokenExpired for one older
+    than TOMBSTONE_TTL.
+    """
+    updated_at, doc_id, deleted_at, tombstone_id = decode_sync_token(since)
+    if deleted_at and deleted_at < (time.time() - TOMBSTONE_TTL) * 1000:
+        raise SyncTokenExpired('Sync token expired')
+    client = get_db()
+    if client is None: return [], [], False, since
+    limit = limit or PAGE_SIZE
+
+    query = client.collection(kind).where('section', '==', section)
+    if doc_id:
+        query = query.order_by('updated_at').order_by('__name__').start_after(
+            {'updated_at': updated_at, '__name__': doc_id})
+    else:
+        query = query.where('updated_at', '>', updated_at).order_by('updated_at').order_by('__name__')
+    if fields:
+        query = query.select(sorted(set(fields) | {'updated_at'}))
+    tombstones = client.collection(TOMBSTONES).where('section', '==', section).where('kind', '==', kind)
+    if tombstone_id:
+        tombstones = tombstones.order_by('deleted_at').order_by('__name__').start_after(
+            {'deleted_at': deleted_at, '__name__': tombstone_id})
+    else:
+        # >=: a deletion in the same millisecond as the token is resent, not missed
+        tombstones = tombstones.where('deleted_at', '>=', deleted_at).order_by('deleted_at').order_by('__name__')
+    tombstones = tombstones.select(['id', 'deleted_at'])
+
+    docs, tombs = fan_out(lambda: _stream(query.limit(limit + 1)), lambda: _stream(tombstones.limit(limit + 1)))
+    if docs is None or tombs is None:
+        raise RuntimeError(f'Could not read {kind} changes')
+    items = [doc.to_dict() | {'id': doc.id} for doc in docs[:limit]]
+    deleted = [doc.to_dict() for doc in tombs[:limit]]
+    has_more = len(docs) > limit or len(tombs) > limit
+    if items:
+        updated_at, doc_id = items[-1]['updated_at'], items[-1]['id']
+    if deleted:
+        deleted_at, tombstone_id = deleted[-1]['deleted_at'], tombs[len(deleted) - 1].id
+    return items, deleted, has_more, encode_sync_token(updated_at, doc_id, deleted_at, tombstone_id)
+
+@profiling.traced
+def backfill_updated_at(kinds=COUNTED):
+    """Stamp `kinds` documents that predate updated_at, so delta sync can see them.
+    Returns the number of documents stamped."""
+    client = get_db()
+    if client is None: return 0
+
+    now_ms = int(time.time() * 1000)
+
+    def writes():
+        for kind in kinds:
+            for doc in client.collection(kind).select(['updated_at']).stream():
+                if (doc.to_dict() or {}).get('updated_at') is None:
+                    yield 'update', doc.reference, {'updated_at': now_ms}
+
+    return write_in_batches(client, writes())
+
+# --- Search ---
+# An inverted index per section: search_terms/<section>:<token> holds
+# {'section', 'postings': {posting key: weight}} (see search_index). Adds and
+# deletes merge single postings in the same batch as the item, so the index
+# never needs a full rebuild; `flask rebuild-search-index` creates it for
+# existing data. A query reads one document per query term (cached).
+# Cached postings and documents are keyed by the section's notes and
+# announcements versions, like the content cache, so results never lag
+# behind the search page's ETag.
+SEARCH_TERMS = 'search_terms'
+SEARCH_MAX_TERMS = 10
+search_cache = TTLCache(name='search', maxsize=int(os.environ.get('SEARCH_CACHE_SIZE', 4096)),
+                        ttl=int(os.environ.get('SEARCH_CACHE_TTL', 300)))
+
+def _term_ref(client, section, token):
+    return client.collection(SEARCH_TERMS).document(f'{section}:{token}')
+
+def _index_writes(client, section, postings):
+    """'merge' writes adding {token: {posting key: weight or DELETE_FIELD}} to the index."""
+    for token, entries in postings.items():
+        yield 'merge', _term_ref(client, section, token), {'section': section, 'postings': entries}
+
+def invalidate_search(section, tokens=None):
+    """Forget cached postings (of `tokens`, or every term) and documents of a section."""
+    tokens = set(tokens) if tokens is not None else None
+    search_cache.invalidate_keys(lambda key: key[0] == section and (
+        tokens is None or key[1] is None or key[1] in tokens))
+
+def _search_version(section):
+    return tuple(content_version(kind, section) for kind in search_index.INDEXED)
+
+def _postings(client, section, tokens):
+    version = _search_version(section)
+    postings, missing = {}, []
+    for token in tokens:
+        cached = search_cache.get((section, token, version))
+        if cached is None:
+            missing.append(token)
+        else:
+            postings[token] = cached
+    if missing:
+        for doc in client.get_all([_term_ref(client, section, token) for token in missing]):
+            token = doc.id.split(':', 1)[1]
+            postings[token] = (doc.to_dict() or {}).get('postings', {}) if doc.exists else {}
+            search_cache.set((section, token, version), postings[token])
+        profiling.record_reads(len(missing))
+    return postings
+
+def _documents(client, section, keys):
+    """Documents for posting keys, in order; keys whose document is gone are skipped."""
+    version = _search_version(section)
+    found, missing = {}, []
+    for key in keys:
+        cached = search_cache.get((section, None, key, version))
+        if cached is None:
+            missing.append(key)
+        else:
+            found[key] = cached
+    if missing:
+        refs = [client.collection(kind).document(doc_id) for kind, doc_id in map(search_index.split_key, missing)]
+        for doc in client.get_all(refs):
+            if doc.exists:
+                key = search_index.posting_key(doc.reference.parent.id, doc.id)
+                found[key] = doc.to_dict() | {'id': doc.id, 'kind': doc.reference.parent.id}
+                search_cache.set((section, None, key, version), found[key])
+        profiling.record_reads(len(missing))
+    return [dict(found[key]) for key in keys if key in found]
+
+@profiling.traced
+def search(section, query, kinds=None, limit=None, offset=0):
+    """Ranked notes and announcements of a section matching `query`.
+
+    Returns (items, total); each item has its `kind` and `score`.
+    """
+    tokens = list(dict.fromkeys(search_index.tokenize(query)))[:SEARCH_MAX_TERMS]
+    client = get_db()
+    if client is None or not tokens or not section: return [], 0
+
+    postings = _postings(client, section, tokens)
+    counts = get_section_counts(section)
+    ranked = search_index.rank(tokens, postings, sum(counts.get(k) or 0 for k in search_index.INDEXED), kinds)
+    page = ranked[offset:offset + (limit or PAGE_SIZE)]
+    scores = dict(page)
+    items = _documents(client, section, [key for key, _ in page])
+    for item in items:
+        item['score'] = round(scores[search_index.posting_key(item['kind'], item['id'])], 3)
+    return items, len(ranked)
+
+@profiling.traced
+def rebuild_search_index(section=None):
+    """Re-index every note and announcement (of one section). Returns the number of terms written."""
+    client = get_db()
+    if client is None: return 0
+
+    postings = {}  # section -> token -> {posting key: weight}
+    for kind in search_index.INDEXED:
+        query = client.collection(kind)
+        if section:
+            query = query.where('section', '==', section)
+        for doc in query.stream():
+            item = doc.to_dict() or {}
+            if not item.get('section'):
+                continue
+            terms = postings.setdefault(item['section'], {})
+            for token, weight in search_index.terms_for(kind, item).items():
+                terms.setdefault(token, {})[search_index.posting_key(kind, doc.id)] = weight
+
+    old = client.collection(SEARCH_TERMS)
+    if section:
+        old = old.where('section', '==', section)
+    write_in_batches(client, (('delete', doc.reference, None) for doc in old.select([]).stream()))
+    written = 0
+    for sec, terms in postings.items():
+        written += write_in_batches(client, (('set', _term_ref(client, sec, token), {'section': sec, 'postings': entries})
+                                             for token, entries in terms.items()))
+        invalidate_search(sec)
+    return written
+
+# --- Announcements ---
 def add_announcement(data):
     client = get_db()
     if client is None: return None
     
-    _, doc_ref = client.collection('announcements').add(data)
+    doc_ref = client.collection('announcements').document()
+    _write_content(client, 'announcements', 'set', doc_ref, data, data.get('section'))
     return doc_ref.id
 
-def delete_announcement(item_id):
+def delete_announcement(item_id, section=None):
     client = get_db()
     if client is None: return False
     
-    client.collection('announcements').document(item_id).delete()
-    return True
+    ref = client.collection('announcements').document(item_id)
+    return _write_content(client, 'announcements', 'delete', ref, section=section)
 
 # --- Notes ---
-def get_notes(section=None):
-    client = get_db()
-    if client is None: return []
-    
-    query = client.collection('notes')
-    if section:
-        query = query.where('section', '==', section)
-    
-    docs = query.stream()
-    res = [doc.to_dict() | {'id': doc.id} for doc in docs]
-    # Sort in memory
-    res.sort(key=lambda x: x.get('date', ''), reverse=True)
-    return res
-
 def add_note(data):
     """
     Saves note metadata to Firestore. 
@@ -93,10 +697,11 @@ def add_note(data):
     if client is None: return None
     
     # Save metadata to Firestore
-    _, doc_ref = client.collection('notes').add(data)
+    doc_ref = client.collection('notes').document()
+    _write_content(client, 'notes', 'set', doc_ref, data, data.get('section'))
     return doc_ref.id
 
-def delete_note(note_id):
+def delete_note(note_id, section=None):
     """
     Deletes note metadata from Firestore.
     Does NOT manage file deletion as files are hosted externally.
@@ -104,11 +709,17 @@ def delete_note(note_id):
     client = get_db()
     if client is None: return False
     
-    client.collection('notes').document(note_id).delete()
-    return True
+    ref = client.collection('notes').document(note_id)
+    return _write_content(client, 'notes', 'delete', ref, section=section)
 
 # --- Contacts ---
 def get_contacts(section=None):
+    if section:
+        return list(_digest_part('contacts', section)['items'])
+    return _cached_list('contacts', section, _load_contacts)
+
+@profiling.traced
+def _load_contacts(section):
     client = get_db()
     if client is None: return []
     
@@ -116,69 +727,626 @@ def get_contacts(section=None):
     if section:
         query = query.where('section', '==', section)
     
-    docs = query.stream()
+    docs = _stream(query)
     return [doc.to_dict() | {'id': doc.id} for doc in docs]
 
 def add_contact(data):
     client = get_db()
     if client is None: return None
     
-    _, doc_ref = client.collection('contacts').add(data)
+    doc_ref = client.collection('contacts').document()
+    _write_content(client, 'contacts', 'set', doc_ref, data, data.get('section'))
     return doc_ref.id
 
-def delete_contact(contact_id):
+def delete_contact(contact_id, section=None):
     client = get_db()
     if client is None: return False
     
-    client.collection('contacts').document(contact_id).delete()
-    return True
+    ref = client.collection('contacts').document(contact_id)
+    return _write_content(client, 'contacts', 'delete', ref, section=section)
+
+# --- Batched writes ---
+BATCH_LIMIT = 500  # Firestore's maximum number of writes per batch
+
+@profiling.traced
+def write_in_batches(client, writes):
+    """Commit an iterable of (op, ref, data) writes in batches of BATCH_LIMIT.
+
+    op is 'set', 'merge' (set with merge=True), 'update' or 'delete'.
+    Writes are consumed lazily, so a generator keeps memory bounded.
+    Returns the number of writes committed.
+    """
+    batch, pending, total = client.batch(), 0, 0
+    for op, ref, data in writes:
+        if op == 'delete':
+            batch.delete(ref)
+        elif op == 'update':
+            batch.update(ref, data)
+        else:
+            batch.set(ref, data, merge=(op == 'merge'))
+        pending += 1
+        if pending == BATCH_LIMIT:
+            batch.commit()
+            total += pending
+            batch, pending = client.batch(), 0
+    if pending:
+        batch.commit()
+        total += pending
+    return total
+
+# --- Bulk import / export ---
+# Validated rows (see bulk_io) are written through write_in_batches, so a
+# whole upload costs one commit per BATCH_LIMIT rows instead of a round
+# trip per row. Rows are consumed lazily as the upload is parsed.
+
+@profiling.traced
+def import_content(kind, section, items):
+    """Add `kind` documents to a section in batches. Returns the number added."""
+    client = get_db()
+    if client is None: return 0
+
+    collection = client.collection(kind)
+    # Every row shares one stamp; delta sync pages by (updated_at, id), so
+    # none of them is skipped at a page boundary
+    now_ms = int(time.time() * 1000)
+    added = 0
+
+    def writes():
+        nonlocal added
+        # Postings are gathered across items so a common term is written once per flush, not per item
+        pending = {}
+        for item in items:
+            ref = collection.document()
+            added += 1
+            yield 'set', ref, item | {'section': section, 'updated_at': now_ms}
+            if kind in search_index.INDEXED:
+                for token, weight in search_index.terms_for(kind, item).items():
+                    pending.setdefault(token, {})[search_index.posting_key(kind, ref.id)] = weight
+                if len(pending) >= BATCH_LIMIT:
+                    yield from _index_writes(client, section, pending)
+                    pending = {}
+        yield from _index_writes(client, section, pending)
+
+    try:
+        write_in_batches(client, writes())
+    finally:
+        # Batches committed before a failure are in Firestore, so make them visible either way
+        if added:
+            invalidate_search(section)
+            batch = client.batch()
+            batch.set(*_version_bump(client, kind, section), merge=True)
+            batch.set(client.collection(SECTION_DIGESTS).document(section), {kind: firestore.DELETE_FIELD}, merge=True)
+            batch.commit()
+            version_cache.invalidate(section)
+            invalidate_section(kind, section)
+            refresh_digest(section, (kind,))
+            _invalidate_counts(kind)
+    return added
+
+@profiling.traced
+def import_users(rows, chunk_size=BATCH_LIMIT // 2):
+    """Create user accounts from (line, user) pairs, skipping taken usernames and emails.
+
+    Existing users and email index entries are checked with one get_all()
+    per chunk. Returns (created, [(line, message), ...]).
+    """
+    client = get_db()
+    if client is None: return 0, []
+
+    users, index = client.collection('users'), client.collection(EMAIL_INDEX)
+    created, conflicts, seen = 0, [], set()
+    rows = iter(rows)
+    while True:
+        chunk = []
+        for line, user in rows:
+            user['email'] = normalize_email(user['email'])
+            if user['username'] in seen or user['email'] in seen:
+                conflicts.append((line, 'Duplicate username or email in this file'))
+                continue
+            seen.update((user['username'], user['email']))
+            chunk.append((line, user))
+            if len(chunk) == chunk_size:
+                break
+        if not chunk:
+            return created, conflicts
+
+        refs = [users.document(u['username']) for _, u in chunk] + [index.document(u['email']) for _, u in chunk]
+        snapshots = list(client.get_all(refs))
+        profiling.record_reads(len(refs))
+        taken = {(doc.reference.parent.id, doc.id) for doc in snapshots if doc.exists}
+
+        def writes():
+            nonlocal created
+            for line, user in chunk:
+                if ('users', user['username']) in taken:
+                    conflicts.append((line, f"Username {user['username']} already exists"))
+                elif (EMAIL_INDEX, user['email']) in taken:
+                    conflicts.append((line, f"Email {user['email']} is already registered"))
+                else:
+                    created += 1
+                    yield 'set', users.document(user['username']), user
+                    yield 'set', index.document(user['email']), {'username': user['username']}
+        write_in_batches(client, writes())
+
+def iter_section(kind, section, fields=None):
+    """Stream every `kind` document of a section without holding them all in memory."""
+    client = get_db()
+    if client is None: return
+
+    query = client.collection(kind).where('section', '==', section)
+    if fields:
+        query = query.select(list(fields))
+    read = 0
+    for doc in query.stream():
+        read += 1
+        yield doc.to_dict() | {'id': doc.id}
+    profiling.record_reads(read or 1)
 
 # --- Users ---
+# `email_index/{normalized email}` maps an email to its username, so a login
+# or password reset by email is a direct document get instead of a query.
+EMAIL_INDEX = 'email_index'
+# Query users by email when the index has no entry. Turn off once
+# `flask backfill-email-index` has been run.
+EMAIL_INDEX_FALLBACK = os.environ.get('EMAIL_INDEX_FALLBACK', 'true').lower() == 'true'
+
+def normalize_email(email):
+    return (email or '').strip().lower()
+
+@profiling.traced
+def get_username_for_email(email):
+    client = get_db()
+    if client is None: return None
+
+    doc = _get(client.collection(EMAIL_INDEX).document(normalize_email(email)))
+    return doc.get('username') if doc.exists else None
+
+@profiling.traced
 def get_user(username):
+    """Look up a user by username or email."""
     client = get_db()
     if client is None: return None
     
-    # Try username as document ID first
-    doc = client.collection('users').document(username).get()
-    if doc.exists:
-        return doc.to_dict()
-    
-    # Otherwise search by email
-    docs = client.collection('users').where('email', '==', username).limit(1).stream()
-    for doc in docs:
-        return doc.to_dict()
+    users = client.collection('users')
+    if '@' not in username:
+        doc = _get(users.document(username))
+        return doc.to_dict() if doc.exists else None
+
+    indexed = get_username_for_email(username)
+    if indexed:
+        doc = _get(users.document(indexed))
+        return doc.to_dict() if doc.exists else None
+
+    if EMAIL_INDEX_FALLBACK:
+        for doc in _stream(users.where('email', '==', username).limit(1)):
+            return doc.to_dict()
     return None
 
-def update_user(username, data):
+def _blank_as_none(value):
+    return None if value == '' else value
+
+def changed_fields(current, updates):
+    """The entries of `updates` whose value differs from `current`'s ('' and None/missing are equal)."""
+    return {k: v for k, v in updates.items() if _blank_as_none(current.get(k)) != _blank_as_none(v)}
+
+def _user_batch(client, username, data, old_email, session=None):
+    batch = client.batch()
+    if data:
+        batch.update(client.collection('users').document(username), data)
+    new_email = normalize_email(data.get('email'))
+    if new_email and new_email != normalize_email(old_email):
+        batch.set(client.collection(EMAIL_INDEX).document(new_email), {'username': username})
+        if old_email:
+            batch.delete(client.collection(EMAIL_INDEX).document(normalize_email(old_email)))
+    if session and session[1]:
+        batch.update(client.collection(SESSIONS).document(session[0]), session[1])
+    return batch
+
+@profiling.traced
+def update_user(username, data, old_email=None, session=None):
+    """Write the fields in `data` (only those) to an existing user.
+
+    Pass `old_email` when data changes the email. `session` is an optional
+    (session_id, fields) pair: that session gets `fields` in the same batch.
+    """
     client = get_db()
     if client is None: return False
-    
-    client.collection('users').document(username).set(data, merge=True)
+
+    try:
+        _user_batch(client, username, data, old_email, session).commit()
+    except _not_found() as e:
+        if not session or not session[1]:
+            raise
+        # Legacy (or just expired) session document: save the user, then rewrite the session
+        print(f"Partial session update failed, rewriting it: {e!r}")
+        _user_batch(client, username, data, old_email).commit()
+        current = get_session(session[0])
+        if current:
+            create_session(current | session[1] | {'session_id': session[0]})
+    if session:
+        session_cache.invalidate(session[0])
     return True
 
-# --- Sessions ---
-def get_session(session_id):
+def backfill_email_index():
+    """Index the email of every existing user. Returns the number of entries written."""
     client = get_db()
-    if client is None: return None
-    
-    docs = client.collection('sessions').where('session_id', '==', session_id).limit(1).stream()
-    for doc in docs:
+    if client is None: return 0
+
+    def writes():
+        for doc in client.collection('users').select(['email']).stream():
+            email = normalize_email((doc.to_dict() or {}).get('email'))
+            if email:
+                yield 'set', client.collection(EMAIL_INDEX).document(email), {'username': doc.id}
+
+    return write_in_batches(client, writes())
+
+# --- Sessions ---
+# Sessions live in `auth_sessions/{session_id}` so lookups are a direct
+# document get, and `session_index/{username}` lists a user's session ids
+# (one per device) for "log out everywhere".
+# Older deployments stored one session per user in `sessions/{username}`;
+# those are still readable until their cookies expire.
+SESSIONS = 'auth_sessions'
+SESSION_INDEX = 'session_index'
+LEGACY_SESSIONS = 'sessions'
+LEGACY_SESSION_FALLBACK = os.environ.get('LEGACY_SESSION_FALLBACK', 'true').lower() == 'true'
+# Sessions expire SESSION_MAX_AGE seconds after their last renewal
+# (`expires_at`, usable as a Firestore TTL field); `flask purge-sessions`
+# deletes expired ones in batches.
+SESSION_MAX_AGE = int(os.environ.get('SESSION_MAX_AGE', 3600 * 24 * 7))
+SESSION_RENEW_INTERVAL = int(os.environ.get('SESSION_RENEW_INTERVAL', 3600))
+# Session ids are str(uuid4()); a cookie of any other shape (e.g. one with a
+# '/', which isn't a valid document id) can't name a session
+SESSION_ID = re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$')
+
+# Sessions are read on every page view but written only at login, settings
+# save and logout, so keep recently used ones in memory.
+session_cache = TTLCache(
+    name='sessions',
+    maxsize=int(os.environ.get('SESSION_CACHE_SIZE', 2048)),
+    ttl=int(os.environ.get('SESSION_CACHE_TTL', 60)),
+)
+
+@profiling.traced
+def _get_legacy_session(client, session_id):
+    for doc in _stream(client.collection(LEGACY_SESSIONS).where('session_id', '==', session_id).limit(1)):
         return doc.to_dict()
     return None
 
-def create_session(session_data):
+def _session_expiry(session, max_age):
+    """When a session expires (UTC), or None if that can't be told."""
+    if session.get('expires_at'):
+        return session['expires_at']
+    # Stored before sessions had expires_at (or legacy): max_age after login
+    try:
+        return datetime.fromisoformat(session['timestamp']).astimezone(timezone.utc) + timedelta(seconds=max_age)
+    except (KeyError, TypeError, ValueError):
+        return None
+
+@profiling.traced
+def get_session(session_id, max_age=None, on_renew=None):
+    """A live session, or None if it doesn't exist or has expired.
+
+    Sessions slide: one used after SESSION_RENEW_INTERVAL seconds gets
+    max_age seconds from now again, so renewal costs at most one write per
+    interval. `on_renew` is called when this lookup renewed it.
+    """
+    if not SESSION_ID.match(session_id or ''):
+        return None
+    max_age = max_age or SESSION_MAX_AGE
+    session = session_cache.get(session_id)
+    client = get_db()
+    if session is None:
+        if client is None: return None
+
+        doc = _get(client.collection(SESSIONS).document(session_id))
+        session = doc.to_dict() if doc.exists else None
+        if session is None and LEGACY_SESSION_FALLBACK:
+            session = _get_legacy_session(client, session_id)
+            if session is not None:
+                session['_legacy'] = True
+        if session is None:
+            return None
+        session_cache.set(session_id, session)
+
+    now = datetime.now(timezone.utc)
+    expires = _session_expiry(session, max_age)
+    if expires is None or expires <= now:
+        delete_session(session_id, session.get('username'))
+        return None
+
+    interval = min(SESSION_RENEW_INTERVAL, max_age // 2)
+    if client is not None and not session.get('_legacy') and expires - now < timedelta(seconds=max_age - interval):
+        expires = now + timedelta(seconds=max_age)
+        try:
+            client.collection(SESSIONS).document(session_id).update({'expires_at': expires})
+        except Exception as e:
+            print(f"Session renewal failed: {e!r}")
+        else:
+            session_cache.set(session_id, session | {'expires_at': expires})
+            if on_renew:
+                on_renew()
+    return {k: v for k, v in session.items() if k not in ('expires_at', '_legacy')}
+
+@profiling.traced
+def create_session(session_data, max_age=None):
+    """Create or overwrite a session. Also used to refresh a session after a profile change."""
     client = get_db()
     if client is None: return None
     
-    # One session per username for simplicity
-    client.collection('sessions').document(session_data['username']).set(session_data)
+    session_id = session_data['session_id']
+    expires = datetime.now(timezone.utc) + timedelta(seconds=max_age or SESSION_MAX_AGE)
+    batch = client.batch()
+    batch.set(client.collection(SESSIONS).document(session_id), session_data | {'expires_at': expires})
+    batch.set(client.collection(SESSION_INDEX).document(session_data['username']),
+              {'session_ids': firestore.ArrayUnion([session_id])}, merge=True)
+    batch.commit()
+    session_cache.invalidate(session_id)
     return True
 
-def delete_session(session_id):
+@profiling.traced
+def delete_session(session_id, username=None):
+    if not SESSION_ID.match(session_id or ''):
+        return False
+    cached = session_cache.get(session_id)
+    session_cache.invalidate(session_id)
     client = get_db()
     if client is None: return False
     
-    docs = client.collection('sessions').where('session_id', '==', session_id).stream()
-    for doc in docs:
-        doc.reference.delete()
+    ref = client.collection(SESSIONS).document(session_id)
+    if username is None:
+        if cached is not None:
+            username = cached.get('username')
+        else:
+            doc = _get(ref)
+            username = doc.get('username') if doc.exists else None
+
+    batch = client.batch()
+    batch.delete(ref)
+    if username:
+        batch.set(client.collection(SESSION_INDEX).document(username),
+                  {'session_ids': firestore.ArrayRemove([session_id])}, merge=True)
+    batch.commit()
+
+    if LEGACY_SESSION_FALLBACK:
+        for doc in _stream(client.collection(LEGACY_SESSIONS).where('session_id', '==', session_id)):
+            doc.reference.delete()
     return True
+
+@profiling.traced
+def delete_user_sessions(username):
+    """Log a user out on every device. Returns the number of sessions removed."""
+    session_cache.invalidate_where(lambda s: s.get('username') == username)
+    client = get_db()
+    if client is None: return 0
+
+    index_ref = client.collection(SESSION_INDEX).document(username)
+    index = _get(index_ref)
+    session_ids = (index.to_dict() or {}).get('session_ids', []) if index.exists else []
+
+    batch = client.batch()
+    for session_id in session_ids:
+        batch.delete(client.collection(SESSIONS).document(session_id))
+    batch.delete(index_ref)
+    if LEGACY_SESSION_FALLBACK:
+        batch.delete(client.collection(LEGACY_SESSIONS).document(username))
+    batch.commit()
+    return len(session_ids)
+
+def _delete_session_writes(client, docs, legacy=False):
+    for doc in docs:
+        yield 'delete', doc.reference, None
+        username = (doc.to_dict() or {}).get('username')
+        if username and not legacy:
+            yield 'merge', client.collection(SESSION_INDEX).document(username), {'session_ids': firestore.ArrayRemove([doc.id])}
+        session_cache.invalidate(doc.id)
+
+@profiling.traced
+def purge_expired_sessions(max_age=None, page_size=BATCH_LIMIT // 2):
+    """Delete expired sessions, one page of documents in memory at a time. Returns the number deleted.
+
+    Only expired documents are read: sessions by `expires_at` (see
+    backfill_session_expiry for ones created before it existed) and
+    legacy sessions, which are never renewed, by login `timestamp`.
+    """
+    client = get_db()
+    if client is None: return 0
+
+    # `timestamp` is a local ISO time
+    cutoff = (datetime.now() - timedelta(seconds=max_age or SESSION_MAX_AGE)).isoformat()
+    removed = 0
+    for name, expired in ((SESSIONS, client.collection(SESSIONS).where('expires_at', '<', datetime.now(timezone.utc))),
+                          (LEGACY_SESSIONS, client.collection(LEGACY_SESSIONS).where('timestamp', '<', cutoff))):
+        # Each page deleted drops out of the query, so it is simply run again
+        query = expired.select(['username']).limit(page_size)
+        while docs := _stream(query):
+            removed += len(docs)
+            write_in_batches(client, _delete_session_writes(client, docs, legacy=(name == LEGACY_SESSIONS)))
+    return removed
+
+@profiling.traced
+def backfill_session_expiry(max_age=None):
+    """Give sessions created before `expires_at` existed one (login time + max_age). Returns the number updated."""
+    client = get_db()
+    if client is None: return 0
+
+    def writes():
+        for doc in client.collection(SESSIONS).select(['timestamp', 'expires_at']).stream():
+            session = doc.to_dict() or {}
+            if not session.get('expires_at'):
+                expires = _session_expiry(session, max_age or SESSION_MAX_AGE) or datetime.now(timezone.utc)
+                yield 'update', doc.reference, {'expires_at': expires}
+
+    return write_in_batches(client, writes())
+
+# Signed tokens (see session_tokens) revoked by logout, until they'd expire anyway
+REVOKED_TOKENS = 'revoked_tokens'
+
+@profiling.traced
+def get_token_state(username, session_id):
+    """(user document or None, revoked) for revalidating a signed session token, in one RPC."""
+    client = get_db()
+    if client is None: return None, False
+
+    user_ref = client.collection('users').document(username)
+    found = {doc.reference.parent.id: doc.to_dict() for doc in client.get_all(
+        [user_ref, client.collection(REVOKED_TOKENS).document(session_id)]) if doc.exists}
+    profiling.record_reads(2)
+    return found.get('users'), REVOKED_TOKENS in found
+
+@profiling.traced
+def revoke_session_token(session_id, max_age):
+    client = get_db()
+    if client is None: return
+    # expire_at lets a Firestore TTL policy remove the marker once the token is dead
+    client.collection(REVOKED_TOKENS).document(session_id).set(
+        {'expire_at': datetime.now(timezone.utc) + timedelta(seconds=max_age)})
+
+@profiling.traced
+def bump_session_generation(username):
+    """Invalidate all signed tokens of a user. Returns the new generation."""
+    client = get_db()
+    if client is None: return 0
+
+    ref = client.collection('users').document(username)
+    ref.set({'session_generation': firestore.Increment(1)}, merge=True)
+    return _get(ref).to_dict().get('session_generation', 0)
+
+# --- Chat (Realtime Database) ---
+# Under chats/section_<section>/:
+#   threads/<student>/<message id>   one student's conversation with the CR
+#   conversations/<student>          summary: last message, timestamp, unread count
+# Messages are posted through the server so the summary stays in step with
+# the thread. Queries need ".indexOn": ["timestamp"] on threads/$student and
+# ".indexOn": ["last_timestamp"] on conversations in the database rules.
+# chats/section_<section>/messages is the old flat feed; see rebuild_chat_index().
+
+# Thread keys are usernames, but Realtime Database keys can't contain
+# . $ # [ ] /, so those (and %) are %XX-escaped. Other usernames are their
+# own key. chatKey() in static/script.js must match.
+_CHAT_KEY_UNSAFE = re.compile(r'[.$#\[\]/%]')
+
+def chat_key(username):
+    return _CHAT_KEY_UNSAFE.sub(lambda m: f'%{ord(m.group()):02X}', username)
+
+def _chat_student(key):
+    return re.sub(r'%([0-9A-F]{2})', lambda m: chr(int(m.group(1), 16)), key)
+
+def _chat_ref(section, path=''):
+    if get_db() is None or not _database_url():
+        return None
+    from firebase_admin import db as rtdb
+    return rtdb.reference(f'chats/section_{section}' + (f'/{path}' if path else ''))
+
+@profiling.traced
+def post_chat_message(section, student, sender, sender_role, text):
+    """Append a message to a student's thread and update its summary. Returns the message or None."""
+    root = _chat_ref(section)
+    if root is None: return None
+
+    msg = {
+        'text': text,
+        'sender': sender,
+        'senderRole': sender_role,
+        'timestamp': int(time.time() * 1000),
+        'section': section,
+    }
+    if sender_role == 'cr':
+        msg['replyTo'] = student
+    thread = chat_key(student)
+    key = root.child(f'threads/{thread}').push().key
+    root.update({
+        f'threads/{thread}/{key}': msg,
+        f'conversations/{thread}/student': student,
+        f'conversations/{thread}/last_text': text,
+        f'conversations/{thread}/last_sender': sender,
+        f'conversations/{thread}/last_timestamp': msg['timestamp'],
+    })
+    unread = root.child(f'conversations/{thread}/unread')
+    if sender_role == 'cr':
+        unread.set(0)
+    else:
+        unread.transaction(lambda current: (current or 0) + 1)
+    return msg | {'id': key}
+
+@profiling.traced
+def get_conversations(section, limit=100):
+    """Thread summaries for the CR inbox, most recent first."""
+    ref = _chat_ref(section, 'conversations')
+    if ref is None: return []
+
+    data = ref.order_by_child('last_timestamp').limit_to_last(limit).get() or {}
+    threads = [summary | {'student': _chat_student(key)} for key, summary in data.items()]
+    threads.sort(key=lambda t: t.get('last_timestamp', 0), reverse=True)
+    return threads
+
+@profiling.traced
+def get_thread_messages(section, student, limit=50, before=None):
+    """Up to `limit` messages of a thread older than `before` (ms), oldest first.
+
+    Returns (messages, has_more).
+    """
+    ref = _chat_ref(section, f'threads/{chat_key(student)}')
+    if ref is None: return [], False
+
+    query = ref.order_by_child('timestamp')
+    if before is not None:
+        query = query.end_at(before - 1)
+    data = query.limit_to_last(limit + 1).get() or {}
+    messages = [msg | {'id': key} for key, msg in data.items()]
+    messages.sort(key=lambda m: m.get('timestamp', 0))
+    return messages[-limit:], len(messages) > limit
+
+@profiling.traced
+def mark_thread_read(section, student):
+    ref = _chat_ref(section, f'conversations/{chat_key(student)}/unread')
+    if ref is not None:
+        ref.set(0)
+
+@profiling.traced
+def rebuild_chat_index(section):
+    """Regenerate threads/ and conversations/ of a section.
+
+    Copies messages from the old flat messages feed into their threads
+    (keeping messages already posted to threads) and recomputes every
+    summary. Returns the number of threads.
+    """
+    root = _chat_ref(section)
+    if root is None: return 0
+
+    threads = root.child('threads').get() or {}
+    old_summaries = root.child('conversations').get() or {}
+    updates = {}
+    for key, msg in (root.child('messages').get() or {}).items():
+        student = msg.get('sender') if msg.get('senderRole') != 'cr' else msg.get('replyTo')
+        thread = student and chat_key(student)
+        if thread and key not in threads.get(thread, {}):
+            threads.setdefault(thread, {})[key] = msg
+            updates[f'threads/{thread}/{key}'] = msg
+
+    for thread, msgs in threads.items():
+        last = max(msgs.values(), key=lambda m: m.get('timestamp', 0))
+        updates[f'conversations/{thread}'] = {
+            'student': _chat_student(thread),
+            'last_text': last.get('text', ''),
+            'last_sender': last.get('sender'),
+            'last_timestamp': last.get('timestamp', 0),
+            'unread': (old_summaries.get(thread) or {}).get('unread', 0),
+        }
+    if updates:
+        root.update(updates)
+    return len(threads)
+
+@profiling.traced
+def list_chat_sections():
+    """Sections that have chat data (for rebuilding every index)."""
+    if get_db() is None or not _database_url():
+        return []
+    from firebase_admin import db as rtdb
+    keys = rtdb.reference('chats').get(shallow=True) or {}
+    return [key[len('section_'):] for key in keys if key.startswith('section_')]
+
+def get_cache_stats():
+    """Hit/miss counters of the in-process caches."""
+    return {'sessions': session_cache.stats(), 'content': content_cache.stats(), 'counts': count_cache.stats(),
+            'versions': version_cache.stats(), 'search': search_cache.stats()}
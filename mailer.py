@@ -0,0 +1,238 @@
+"""
+JMIConnect - Outbound Mail
+Queues email messages and sends them from a background worker over a
+reused, logged-in SMTP connection, retrying transient failures with
+exponential backoff. Request handlers only pay for enqueueing.
+
+Configuration (environment):
+    JMI_EMAIL / JMI_EMAIL_PASSWORD   sender account
+    SMTP_HOST / SMTP_PORT / SMTP_SSL defaults: smtp.gmail.com / 465 / true
+    MAIL_ASYNC                       "false" sends inline. Defaults to false on
+                                     Vercel (VERCEL is set), which freezes the
+                                     process, and its worker, after a response
+
+For local testing point SMTP_HOST/SMTP_PORT at a debugging sink, e.g.
+    python -m aiosmtpd -n -l localhost:1025   (with SMTP_SSL=false)
+"""
+import os
+import queue
+import smtplib
+import threading
+import time
+import uuid
+from email.message import EmailMessage
+
+from cache import TTLCache
+
+QUEUED, SENDING, SENT, FAILED = 'queued', 'sending', 'sent', 'failed'
+
+# --- Rendering ---
+# Each message type has templates/email/<kind>.html and <kind>.txt. The
+# Jinja environment is independent of the Flask app (the worker thread has
+# no app context), compiles each template once and never re-checks the files.
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+
+SUBJECTS = {
+    'otp': 'JMIConnect - Password Reset OTP',
+    'password_changed': 'JMIConnect - Your password was changed',
+    'announcement_digest': 'JMIConnect - New announcements',
+}
+
+_env = None
+
+def _environment():
+    global _env
+    if _env is None:
+        from jinja2 import Environment, FileSystemLoader, select_autoescape
+        _env = Environment(loader=FileSystemLoader(TEMPLATE_DIR),
+                           autoescape=select_autoescape(['html']),
+                           auto_reload=False)
+    return _env
+
+def render_email(kind, **context):
+    """Render a message type to (html, text)."""
+    env = _environment()
+    html = env.get_template(f'email/{kind}.html').render(**context)
+    text = env.get_template(f'email/{kind}.txt').render(**context)
+    return html, text
+
+def build_message(kind, recipient, sender, **context):
+    """EmailMessage for a message type with plain-text and HTML parts."""
+    html, text = render_email(kind, **context)
+    msg = EmailMessage()
+    msg['Subject'] = SUBJECTS[kind]
+    msg['From'] = f'JMIConnect <{sender}>'
+    msg['To'] = recipient
+    msg.set_content(text)
+    msg.add_alternative(html, subtype='html')
+    return msg
+
+
+class Mailer:
+    def __init__(self, host, port, username=None, password=None, use_ssl=True,
+                 max_retries=3, backoff=2.0, idle_timeout=60, send_async=True):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_ssl = use_ssl
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.idle_timeout = idle_timeout
+        self.send_async = send_async
+        self.sent = 0
+        self.failed = 0
+        self.last_failure = None  # {'at', 'to', 'error'} of the latest message that failed
+        self.last_sent_at = None
+        self._queue = queue.Queue()
+        self._statuses = TTLCache(maxsize=10000, ttl=3600 * 24)
+        self._smtp = None
+        self._lock = threading.Lock()  # guards the SMTP connection, held for a whole send
+        self._worker_lock = threading.Lock()
+        self._worker = None
+
+    # --- Public API ---
+    def enqueue(self, msg):
+        """Queue an EmailMessage for delivery and return its message id."""
+        message_id = uuid.uuid4().hex
+        self._set_status(message_id, QUEUED, attempts=0)
+        if not self.send_async:
+            self._deliver(message_id, msg)
+            return message_id
+        self._queue.put((message_id, msg))
+        self._ensure_worker()
+        return message_id
+
+    def send_template(self, kind, recipient, **context):
+        """Render a message type (see render_email) and queue it. Returns the message id."""
+        return self.enqueue(build_message(kind, recipient, self.username, **context))
+
+    def status(self, message_id):
+        """{'state': queued|sending|sent|failed, 'attempts': n, 'error': ...} or None.
+
+        Queued messages are still 'queued' right after enqueue(); only
+        inline sending (send_async=False) has the outcome by then.
+        """
+        return self._statuses.get(message_id)
+
+    def stats(self):
+        """Delivery totals; `failing` is set while the latest delivery failed."""
+        last = self.last_failure
+        return {'sent': self.sent, 'failed': self.failed, 'queued': self._queue.qsize(),
+                'failing': bool(last and (self.last_sent_at is None or last['at'] > self.last_sent_at)),
+                'last_failure': last}
+
+    def flush(self, timeout=None):
+        """Block until every queued message has been handled (for tests and scripts)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def close(self):
+        with self._lock:
+            if self._smtp is not None:
+                try:
+                    self._smtp.quit()
+                except (smtplib.SMTPException, OSError):
+                    pass
+                self._smtp = None
+
+    # --- Internals ---
+    def _set_status(self, message_id, state, **extra):
+        self._statuses.set(message_id, {'state': state, **extra})
+
+    def _ensure_worker(self):
+        # Not self._lock: enqueue() must not wait for a send in progress
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='mailer', daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            try:
+                message_id, msg = self._queue.get(timeout=self.idle_timeout)
+            except queue.Empty:
+                # Don't hold an idle connection open; reconnect on the next message
+                self.close()
+                continue
+            try:
+                self._deliver(message_id, msg)
+            finally:
+                self._queue.task_done()
+
+    def _connect(self):
+        if self.use_ssl:
+            smtp = smtplib.SMTP_SSL(self.host, self.port, timeout=30)
+        else:
+            smtp = smtplib.SMTP(self.host, self.port, timeout=30)
+        if self.username and self.password:
+            smtp.login(self.username, self.password)
+        return smtp
+
+    def _send(self, msg):
+        with self._lock:
+            if self._smtp is None:
+                self._smtp = self._connect()
+            try:
+                self._smtp.send_message(msg)
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                # The pooled connection went stale; retry once on a fresh one
+                self._smtp = self._connect()
+                self._smtp.send_message(msg)
+
+    def _deliver(self, message_id, msg):
+        for attempt in range(1, self.max_retries + 1):
+            self._set_status(message_id, SENDING, attempts=attempt)
+            try:
+                self._send(msg)
+            except smtplib.SMTPAuthenticationError as e:
+                # Retrying won't fix bad credentials
+                print("ERROR: SMTP Authentication failed. Check email credentials.")
+                self._fail(message_id, attempt, e, msg['To'])
+                return False
+            except (smtplib.SMTPException, OSError) as e:
+                print(f"ERROR: SMTP error on attempt {attempt} for {msg['To']}: {e}")
+                self.close()
+                if attempt == self.max_retries:
+                    self._fail(message_id, attempt, e, msg['To'])
+                    return False
+                time.sleep(self.backoff ** (attempt - 1))
+            else:
+                self.sent += 1
+                self.last_sent_at = time.time()
+                self._set_status(message_id, SENT, attempts=attempt)
+                print(f"Email sent successfully to {msg['To']}")
+                return True
+        return False
+
+    def _fail(self, message_id, attempt, error, recipient=None):
+        self.failed += 1
+        self.last_failure = {'at': time.time(), 'to': recipient, 'error': str(error)}
+        self._set_status(message_id, FAILED, attempts=attempt, error=str(error))
+
+
+_mailer = None
+_mailer_lock = threading.Lock()
+
+def get_mailer():
+    """The process-wide Mailer built from the environment, or None if not configured."""
+    global _mailer
+    if _mailer is None:
+        sender_email = os.getenv('JMI_EMAIL')
+        if not sender_email:
+            return None
+        with _mailer_lock:
+            if _mailer is None:
+                _mailer = Mailer(
+                    host=os.getenv('SMTP_HOST', 'smtp.gmail.com'),
+                    port=int(os.getenv('SMTP_PORT', 465)),
+                    username=sender_email,
+                    password=os.getenv('JMI_EMAIL_PASSWORD'),
+                    use_ssl=os.getenv('SMTP_SSL', 'true').lower() == 'true',
+                    send_async=os.getenv('MAIL_ASYNC', 'false' if os.getenv('VERCEL') else 'true').lower() == 'true',
+                )
+    return _mailer
@@ -1,33 +1,135 @@
-import smtplib
-import random
+import hashlib
+import hmac
 import os
-from email.message import EmailMessage
+import secrets
+import threading
+import time
 from datetime import datetime, timedelta
 import json
 
-# In-memory OTP storage (for production, use Redis or database)
-otp_storage = {}
+from flask import current_app, has_app_context
+
+import mailer
+
+OTP_TTL = timedelta(minutes=10)
+
+
+class MemoryOTPStore:
+    """Process-local OTP store. Only correct with a single worker process.
+
+    Expired entries are swept at most every `sweep_interval` seconds during
+    writes, and the oldest entries are dropped beyond `max_entries`.
+    """
+
+    def __init__(self, max_entries=10000, sweep_interval=60):
+        self.max_entries = max_entries
+        self.sweep_interval = sweep_interval
+        self._data = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+
+    def get(self, username):
+        with self._lock:
+            record = self._data.get(username)
+            return dict(record) if record else None
+
+    def put(self, username, record):
+        with self._lock:
+            self._data.pop(username, None)
+            self._data[username] = dict(record)
+            self._sweep()
+
+    def delete(self, username):
+        with self._lock:
+            self._data.pop(username, None)
+
+    def _sweep(self):
+        now = time.monotonic()
+        if now - self._last_sweep >= self.sweep_interval:
+            self._last_sweep = now
+            current = datetime.now()
+            for username in [u for u, r in self._data.items()
+                             if datetime.fromisoformat(r['expiry']) < current]:
+                del self._data[username]
+        # dicts keep insertion order, so the first keys are the oldest OTPs
+        while len(self._data) > self.max_entries:
+            del self._data[next(iter(self._data))]
+
+    def __len__(self):
+        return len(self._data)
+
+
+class FirestoreOTPStore:
+    """OTP store shared by every worker, kept in the `otp_codes` collection.
+
+    Each document carries an `expire_at` timestamp so a Firestore TTL policy
+    on that field can remove abandoned codes.
+    """
+
+    COLLECTION = 'otp_codes'
+
+    def _ref(self, username):
+        import firebase_service as fb
+        client = fb.get_db()
+        if client is None:
+            raise RuntimeError("Firestore is not available")
+        return client.collection(self.COLLECTION).document(username)
+
+    def get(self, username):
+        doc = self._ref(username).get()
+        if not doc.exists:
+            return None
+        record = doc.to_dict()
+        record.pop('expire_at', None)
+        return record
+
+    def put(self, username, record):
+        self._ref(username).set(record | {'expire_at': datetime.fromisoformat(record['expiry'])})
+
+    def delete(self, username):
+        self._ref(username).delete()
+
+
+_store = None
+
+def get_store():
+    """The configured OTP store (OTP_STORE=memory|firestore).
+
+    Defaults to Firestore, which every worker and instance shares; the
+    memory store is the default only in debug and testing.
+    """
+    global _store
+    if _store is None:
+        local = has_app_context() and (current_app.debug or current_app.testing)
+        backend = os.getenv('OTP_STORE', 'memory' if local else 'firestore').lower()
+        _store = FirestoreOTPStore() if backend == 'firestore' else MemoryOTPStore()
+    return _store
 
 def generate_otp():
     """Generate a random 6-digit OTP"""
-    return str(random.randint(100000, 999999))
+    return str(100000 + secrets.randbelow(900000))
+
+def _otp_hash(username, otp):
+    # Keyed on the app secret, so a leaked store doesn't give away live codes
+    key = current_app.config['SECRET_KEY'].encode()
+    return hmac.new(key, f'{username}:{otp}'.encode(), hashlib.sha256).hexdigest()
 
 def store_otp(username, otp):
-    """Store OTP with expiry time (10 minutes)"""
-    expiry_time = datetime.now() + timedelta(minutes=10)
-    otp_storage[username] = {
-        'otp': otp,
+    """Store a hash of the OTP with expiry time (10 minutes)"""
+    expiry_time = datetime.now() + OTP_TTL
+    get_store().put(username, {
+        'otp_hash': _otp_hash(username, otp),
         'expiry': expiry_time.isoformat(),
         'used': False
-    }
+    })
 
 def verify_otp(username, otp):
     """Verify OTP and check expiry"""
-    if username not in otp_storage:
+    store = get_store()
+    stored_data = store.get(username)
+    if stored_data is None:
         return False, "No OTP found for this username"
     
-    stored_data = otp_storage[username]
-    
     # Check if already used
     if stored_data['used']:
         return False, "OTP has already been used"
@@ -35,107 +137,55 @@ def verify_otp(username, otp):
     # Check expiry
     expiry_time = datetime.fromisoformat(stored_data['expiry'])
     if datetime.now() > expiry_time:
-        del otp_storage[username]
+        store.delete(username)
         return False, "OTP has expired"
     
-    # Check OTP match
-    if stored_data['otp'] != otp:
+    # Check OTP match (constant time)
+    if not hmac.compare_digest(stored_data.get('otp_hash', ''), _otp_hash(username, str(otp or ''))):
         return False, "Invalid OTP"
     
     # Mark as used
-    otp_storage[username]['used'] = True
+    store.put(username, stored_data | {'used': True})
     return True, "OTP verified successfully"
 
+def is_otp_verified(username):
+    """True if the user has verified an OTP that hasn't expired or been consumed yet"""
+    stored_data = get_store().get(username)
+    if not stored_data or not stored_data.get('used'):
+        return False
+    return datetime.now() <= datetime.fromisoformat(stored_data['expiry'])
+
 def invalidate_otp(username):
     """Invalidate OTP after password reset"""
-    if username in otp_storage:
-        del otp_storage[username]
+    get_store().delete(username)
 
 def send_otp_email(recipient_email, username, otp):
-    """Send OTP via Gmail SMTP"""
+    """Queue the OTP email for delivery (see mailer.py)"""
+    return _send('otp', recipient_email, username=username, otp=otp,
+                 valid_minutes=int(OTP_TTL.total_seconds() // 60))
+
+def send_password_changed_email(recipient_email, username):
+    """Queue a confirmation that the account password was changed"""
+    return _send('password_changed', recipient_email, username=username,
+                 changed_at=datetime.now().strftime('%d %b %Y, %I:%M %p'))
+
+def _send(kind, recipient_email, **context):
     try:
-        # Get credentials from environment variables
-        sender_email = os.getenv('JMI_EMAIL')
-        sender_password = os.getenv('JMI_EMAIL_PASSWORD')
-        
-        if not sender_email or not sender_password:
+        mailer_instance = mailer.get_mailer()
+        if mailer_instance is None:
             print("ERROR: Email credentials not found in environment variables")
             return False, "Email service not configured"
+
+        # Sent inline, or handed to the background sender (then the outcome
+        # is only known later, from mailer.status() / stats())
+        message_id = mailer_instance.send_template(kind, recipient_email, **context)
+        status = mailer_instance.status(message_id) or {}
+        if status.get('state') == mailer.FAILED:
+            return False, "Failed to send email"
         
-        # Create email message
-        msg = EmailMessage()
-        msg['Subject'] = 'JMIConnect - Password Reset OTP'
-        msg['From'] = f'JMIConnect <{sender_email}>'
-        msg['To'] = recipient_email
-        
-        # Email body with professional HTML
-        html_content = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <style>
-                body {{ font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; background-color: #f4f4f4; margin: 0; padding: 0; }}
-                .container {{ max-width: 600px; margin: 40px auto; background: white; border-radius: 12px; overflow: hidden; box-shadow: 0 4px 12px rgba(0,0,0,0.1); }}
-                .header {{ background: linear-gradient(135deg, #10b981, #065f46); color: white; padding: 30px; text-align: center; }}
-                .header h1 {{ margin: 0; font-size: 28px; font-weight: 800; }}
-                .content {{ padding: 40px 30px; }}
-                .otp-box {{ background: #f1f5f9; border-left: 4px solid #10b981; padding: 20px; margin: 25px 0; border-radius: 8px; }}
-                .otp-code {{ font-size: 36px; font-weight: 800; color: #065f46; letter-spacing: 8px; text-align: center; margin: 10px 0; }}
-                .warning {{ background: #fef2f2; border-left: 4px solid #ef4444; padding: 15px; margin: 20px 0; border-radius: 8px; color: #991b1b; font-size: 14px; }}
-                .footer {{ background: #f8fafc; padding: 20px; text-align: center; color: #64748b; font-size: 13px; }}
-                .btn {{ display: inline-block; background: #10b981; color: white; padding: 12px 30px; text-decoration: none; border-radius: 8px; font-weight: 600; margin: 20px 0; }}
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <div class="header">
-                    <h1>🔐 Password Reset Request</h1>
-                </div>
-                <div class="content">
-                    <p style="font-size: 16px; color: #1f2937;">Hello <strong>{username}</strong>,</p>
-                    <p style="color: #6b7280;">We received a request to reset your password for your JMIConnect account. Use the OTP below to proceed:</p>
-                    
-                    <div class="otp-box">
-                        <p style="margin: 0; color: #475569; font-size: 14px; text-align: center;">Your One-Time Password</p>
-                        <div class="otp-code">{otp}</div>
-                        <p style="margin: 0; color: #64748b; font-size: 12px; text-align: center;">Valid for 10 minutes</p>
-                    </div>
-                    
-                    <div class="warning">
-                        <strong>⚠️ Security Notice:</strong><br>
-                        • Never share this OTP with anyone<br>
-                        • JMIConnect will never ask for your password via email<br>
-                        • If you didn't request this, please ignore this email
-                    </div>
-                    
-                    <p style="color: #6b7280; font-size: 14px;">This OTP will expire in <strong>10 minutes</strong> and can only be used once.</p>
-                </div>
-                <div class="footer">
-                    <p style="margin: 0;">© 2026 JMIConnect | Jamia Millia Islamia</p>
-                    <p style="margin: 5px 0 0 0;">This is an automated email. Please do not reply.</p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-        
-        msg.set_content("Your OTP for password reset is: " + otp)
-        msg.add_alternative(html_content, subtype='html')
-        
-        # Send email via Gmail SMTP
-        with smtplib.SMTP_SSL('smtp.gmail.com', 465) as smtp:
-            smtp.login(sender_email, sender_password)
-            smtp.send_message(msg)
-        
-        print(f"OTP email sent successfully to {recipient_email}")
-        return True, "OTP sent successfully"
+        print(f"{kind} email {status.get('state', 'queued')} for {recipient_email} ({message_id})")
+        return True, "OTP sent successfully" if kind == 'otp' else "Email sent successfully"
         
-    except smtplib.SMTPAuthenticationError:
-        print("ERROR: SMTP Authentication failed. Check email credentials.")
-        return False, "Email authentication failed"
-    except smtplib.SMTPException as e:
-        print(f"ERROR: SMTP error occurred: {str(e)}")
-        return False, "Failed to send email"
     except Exception as e:
         print(f"ERROR: Unexpected error sending email: {str(e)}")
         return False, "An error occurred while sending email"
@@ -0,0 +1,274 @@
+"""
+JMIConnect - Request profiling
+Measures where a request's time goes when PROFILING is on:
+
+- every instrumented firebase_service function call (count, latency,
+  errors), including calls answered from a cache, and the Firestore
+  documents actually read (the measure of datastore use);
+- template rendering time;
+- cache hits and misses of the named TTLCaches.
+
+Each request reports through a Server-Timing header (visible in the
+browser's network panel) and one JSON log line; process-wide totals are
+served by /api/metrics in the Prometheus text format. Log lines go to the
+"jmiconnect.requests" logger at INFO. With PROFILING off nothing is
+registered and the instrumentation returns immediately.
+"""
+import contextvars
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from functools import wraps
+
+enabled = False
+logger = logging.getLogger('jmiconnect.requests')
+
+# The Profile of the request being handled (copied into fan_out threads)
+_current = contextvars.ContextVar('profile', default=None)
+# Nesting depth of instrumented calls, so a call's time isn't counted twice
+_depth = contextvars.ContextVar('profile_depth', default=0)
+
+
+class Profile:
+    """Measurements of one request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.ops = defaultdict(lambda: [0, 0.0, 0])  # op -> [calls, seconds, errors]
+        self.service_seconds = 0.0  # time in outermost firebase_service calls
+        self.reads = 0
+        self.render_seconds = 0.0
+        self.cache = defaultdict(lambda: [0, 0])  # cache name -> [hits, misses]
+        self._lock = threading.Lock()
+
+    @property
+    def service_calls(self):
+        return sum(calls for calls, _, _ in self.ops.values())
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+
+class Metrics:
+    """Process-wide totals, rendered for /api/metrics."""
+
+    def __init__(self):
+        self.requests = defaultdict(lambda: [0, 0.0])  # (endpoint, method, status) -> [count, seconds]
+        self.ops = defaultdict(lambda: [0, 0.0, 0])
+        self.reads = 0
+        self.render_seconds = 0.0
+        self.throttle = defaultdict(int)  # (endpoint, scope, outcome) -> attempts
+        self._lock = threading.Lock()
+
+    def record_request(self, endpoint, method, status, profile):
+        with self._lock:
+            entry = self.requests[(endpoint, method, status)]
+            entry[0] += 1
+            entry[1] += profile.elapsed()
+            self.render_seconds += profile.render_seconds
+
+    def record_op(self, name, seconds, failed):
+        with self._lock:
+            entry = self.ops[name]
+            entry[0] += 1
+            entry[1] += seconds
+            entry[2] += failed
+
+    def record_reads(self, n):
+        with self._lock:
+            self.reads += n
+
+    def record_throttle(self, endpoint, scope, allowed):
+        with self._lock:
+            self.throttle[(endpoint, scope, 'allowed' if allowed else 'limited')] += 1
+
+    def render(self, cache_stats, mail_stats=None):
+        """Prometheus text exposition of the totals and the given cache and mailer stats."""
+        lines = [
+            '# HELP jmi_requests_total HTTP requests handled.',
+            '# TYPE jmi_requests_total counter',
+        ]
+        with self._lock:
+            requests = dict(self.requests)
+            ops = dict(self.ops)
+            reads, render_seconds = self.reads, self.render_seconds
+            throttle = dict(self.throttle)
+        for (endpoint, method, status), (count, _) in sorted(requests.items()):
+            lines.append(f'jmi_requests_total{{endpoint="{endpoint}",method="{method}",status="{status}"}} {count}')
+        lines += ['# HELP jmi_request_seconds_total Time spent handling HTTP requests.',
+                  '# TYPE jmi_request_seconds_total counter']
+        for (endpoint, method, status), (_, seconds) in sorted(requests.items()):
+            lines.append(f'jmi_request_seconds_total{{endpoint="{endpoint}",method="{method}",status="{status}"}} {seconds:.6f}')
+        lines += ['# HELP jmi_service_calls_total Instrumented firebase_service function calls, cache hits included.',
+                  '# TYPE jmi_service_calls_total counter']
+        lines += [f'jmi_service_calls_total{{op="{op}"}} {calls}' for op, (calls, _, _) in sorted(ops.items())]
+        lines += ['# HELP jmi_service_seconds_total Time spent in firebase_service function calls.',
+                  '# TYPE jmi_service_seconds_total counter']
+        lines += [f'jmi_service_seconds_total{{op="{op}"}} {seconds:.6f}' for op, (_, seconds, _) in sorted(ops.items())]
+        lines += ['# HELP jmi_service_errors_total firebase_service function calls that raised.',
+                  '# TYPE jmi_service_errors_total counter']
+        lines += [f'jmi_service_errors_total{{op="{op}"}} {errors}' for op, (_, _, errors) in sorted(ops.items())]
+        lines += ['# HELP jmi_documents_read_total Firestore documents read (billed reads).',
+                  '# TYPE jmi_documents_read_total counter',
+                  f'jmi_documents_read_total {reads}',
+                  '# HELP jmi_template_render_seconds_total Time spent rendering templates.',
+                  '# TYPE jmi_template_render_seconds_total counter',
+                  f'jmi_template_render_seconds_total {render_seconds:.6f}']
+        lines += ['# HELP jmi_rate_limit_checks_total Rate limit checks by outcome (see rate_limit).',
+                  '# TYPE jmi_rate_limit_checks_total counter']
+        lines += [f'jmi_rate_limit_checks_total{{endpoint="{e}",scope="{sc}",outcome="{o}"}} {n}'
+                  for (e, sc, o), n in sorted(throttle.items())]
+        for metric, key, kind in (('jmi_cache_hits_total', 'hits', 'counter'),
+                                  ('jmi_cache_stale_hits_total', 'stale_hits', 'counter'),
+                                  ('jmi_cache_misses_total', 'misses', 'counter'),
+                                  ('jmi_cache_entries', 'size', 'gauge')):
+            lines.append(f'# TYPE {metric} {kind}')
+            lines += [f'{metric}{{cache="{name}"}} {stats[key]}' for name, stats in sorted(cache_stats.items())]
+        if mail_stats:
+            last = mail_stats['last_failure']
+            lines += ['# HELP jmi_mail_sent_total Emails delivered.',
+                      '# TYPE jmi_mail_sent_total counter',
+                      f'jmi_mail_sent_total {mail_stats["sent"]}',
+                      '# HELP jmi_mail_failed_total Emails given up on after retries.',
+                      '# TYPE jmi_mail_failed_total counter',
+                      f'jmi_mail_failed_total {mail_stats["failed"]}',
+                      '# TYPE jmi_mail_queued gauge',
+                      f'jmi_mail_queued {mail_stats["queued"]}',
+                      '# HELP jmi_mail_last_failure_timestamp_seconds When the latest email failed (0: never).',
+                      '# TYPE jmi_mail_last_failure_timestamp_seconds gauge',
+                      f'jmi_mail_last_failure_timestamp_seconds {last["at"] if last else 0:.0f}']
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+# --- Instrumentation hooks ---
+def traced(f):
+    """Record calls, latency and errors of a firebase_service function (whether or not it hits Firestore)."""
+    name = f.__name__.lstrip('_')
+
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        if not enabled:
+            return f(*args, **kwargs)
+        depth = _depth.get()
+        token = _depth.set(depth + 1)
+        started = time.perf_counter()
+        failed = False
+        try:
+            return f(*args, **kwargs)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            seconds = time.perf_counter() - started
+            _depth.reset(token)
+            metrics.record_op(name, seconds, failed)
+            profile = _current.get()
+            if profile is not None:
+                with profile._lock:
+                    entry = profile.ops[name]
+                    entry[0] += 1
+                    entry[1] += seconds
+                    entry[2] += failed
+                    if depth == 0:
+                        profile.service_seconds += seconds
+    return wrapper
+
+
+def record_reads(n):
+    """Count Firestore documents read (an empty query result still bills one)."""
+    if not enabled:
+        return
+    metrics.record_reads(n)
+    profile = _current.get()
+    if profile is not None:
+        with profile._lock:
+            profile.reads += n
+
+
+def record_cache(name, hit):
+    profile = _current.get()
+    if profile is not None:
+        with profile._lock:
+            profile.cache[name][0 if hit else 1] += 1
+
+
+# --- Flask integration ---
+def server_timing(profile):
+    ops = ', '.join(f'{op} x{calls}' for op, (calls, _, _) in sorted(profile.ops.items()))
+    hits = sum(h for h, _ in profile.cache.values())
+    misses = sum(m for _, m in profile.cache.values())
+    parts = [
+        f'service;dur={profile.service_seconds * 1000:.1f};desc="{profile.service_calls} calls, {profile.reads} reads'
+        + (f': {ops}' if ops else '') + '"',
+        f'render;dur={profile.render_seconds * 1000:.1f}',
+        f'cache;desc="{hits} hits, {misses} misses"',
+        f'total;dur={profile.elapsed() * 1000:.1f}',
+    ]
+    return ', '.join(parts)
+
+
+def log_line(request, response, profile):
+    return json.dumps({
+        'event': 'request',
+        'method': request.method,
+        'path': request.path,
+        'endpoint': request.endpoint,
+        'status': response.status_code,
+        'ms': round(profile.elapsed() * 1000, 1),
+        'service_ms': round(profile.service_seconds * 1000, 1),
+        'service_calls': profile.service_calls,
+        'reads': profile.reads,
+        'render_ms': round(profile.render_seconds * 1000, 1),
+        'ops': {op: {'calls': c, 'ms': round(s * 1000, 1), 'errors': e} for op, (c, s, e) in profile.ops.items()},
+        'cache': {name: {'hits': h, 'misses': m} for name, (h, m) in profile.cache.items()},
+    }, separators=(',', ':'))
+
+
+def init_app(app):
+    """Profile every request of `app` when its PROFILING setting is on."""
+    global enabled
+    if not app.config.get('PROFILING'):
+        return
+    enabled = True
+    logger.setLevel(logging.INFO)
+    if not logger.handlers and not logging.getLogger().handlers:
+        logger.addHandler(logging.StreamHandler())
+
+    from flask import before_render_template, g, request, template_rendered
+
+    @app.before_request
+    def start_profile():
+        _current.set(Profile())
+
+    @app.after_request
+    def finish_profile(response):
+        profile = _current.get()
+        if profile is None:
+            return response
+        response.headers['Server-Timing'] = server_timing(profile)
+        metrics.record_request(request.endpoint or 'unmatched', request.method, response.status_code, profile)
+        logger.info(log_line(request, response, profile))
+        return response
+
+    @app.teardown_request
+    def end_profile(exc=None):
+        _current.set(None)
+
+    def render_started(sender, template, context, **extra):
+        profile = _current.get()
+        if profile is not None:
+            g.render_started = time.perf_counter()
+
+    def render_finished(sender, template, context, **extra):
+        profile = _current.get()
+        started = g.pop('render_started', None)
+        if profile is not None and started is not None:
+            profile.render_seconds += time.perf_counter() - started
+
+    before_render_template.connect(render_started, app, weak=False)
+    template_rendered.connect(render_finished, app, weak=False)
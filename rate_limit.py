@@ -0,0 +1,218 @@
+"""
+JMIConnect - Attempt throttling
+Sliding-window limits on the endpoints that are expensive to abuse: login
+(slow password hash), OTP requests (an email each) and OTP verification
+(guessing a 6-digit code). Each endpoint has limits per username, per
+client IP and across all clients; a request over any of them gets a 429
+with Retry-After before the view does any work.
+
+Backends (RATE_LIMIT_STORE):
+    firestore  shared by every worker and instance, `rate_limits` collection
+               (default)
+    memory     per process, so limits multiply with the worker and instance
+               count (default in debug and testing)
+
+Limits can be overridden as RATE_LIMIT_<ENDPOINT>_<SCOPE>="count/seconds",
+e.g. RATE_LIMIT_LOGIN_USER=10/900; "0" turns a limit off.
+"""
+import hashlib
+import math
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import current_app, has_app_context, jsonify, request
+
+import profiling
+
+# endpoint -> scope -> (requests, window seconds)
+DEFAULT_LIMITS = {
+    'login': {'user': (10, 900), 'ip': (30, 300), 'global': (300, 60)},
+    'otp_request': {'user': (3, 900), 'ip': (10, 3600), 'global': (100, 3600)},
+    'otp_verify': {'user': (5, 600), 'ip': (30, 600)},
+}
+
+
+def _limits(endpoint):
+    limits = {}
+    for scope, default in DEFAULT_LIMITS[endpoint].items():
+        raw = os.getenv(f'RATE_LIMIT_{endpoint}_{scope}'.upper())
+        if raw is None:
+            limits[scope] = default
+        elif raw.strip() not in ('', '0'):
+            count, seconds = raw.split('/')
+            limits[scope] = (int(count), int(seconds))
+    return limits
+
+
+class MemoryLimiterStore:
+    """Exact sliding-window log per key, kept in this process.
+
+    Only allowed hits are recorded, so a key holds at most `limit`
+    timestamps. Idle keys are swept at most every `sweep_interval` seconds.
+    """
+
+    def __init__(self, sweep_interval=60):
+        self.sweep_interval = sweep_interval
+        self._hits = {}  # key -> (window, deque of timestamps)
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+
+    def hit(self, key, limit, window):
+        """Record an attempt. Returns (allowed, seconds until the next one would be)."""
+        position, retry_after = self.hit_all([(key, limit, window)])
+        return position is None, retry_after
+
+    def hit_all(self, hits):
+        """Check an attempt against every (key, limit, window) and record it
+        against all of them only if none is exceeded, so a rejected attempt
+        uses up no limit. Returns (position of the first exceeded or None,
+        retry after)."""
+        now = time.monotonic()
+        with self._lock:
+            self._sweep(now)
+            logs = []
+            for position, (key, limit, window) in enumerate(hits):
+                _, log = self._hits.setdefault(key, (window, deque()))
+                while log and log[0] <= now - window:
+                    log.popleft()
+                if len(log) >= limit:
+                    return position, log[0] + window - now
+                logs.append(log)
+            for log in logs:
+                log.append(now)
+            return None, 0
+
+    def _sweep(self, now):
+        if now - self._last_sweep < self.sweep_interval:
+            return
+        self._last_sweep = now
+        for key in [k for k, (window, hits) in self._hits.items() if not hits or hits[-1] <= now - window]:
+            del self._hits[key]
+
+    def __len__(self):
+        return len(self._hits)
+
+
+class FirestoreLimiterStore:
+    """Sliding-window counter shared by every worker, in the `rate_limits` collection.
+
+    Each key keeps a counter per fixed window; the rate is the current
+    window's count plus the previous one's, weighted by how much of it still
+    overlaps the sliding window. Like the memory store, only allowed attempts
+    are counted. A check reads every key of an endpoint with one get_all and
+    counts an allowed attempt against all of them in one batch; concurrent
+    attempts between the two can overshoot a limit slightly. Documents
+    carry `expire_at` for a Firestore TTL policy.
+    """
+
+    COLLECTION = 'rate_limits'
+
+    def hit(self, key, limit, window):
+        position, retry_after = self.hit_all([(key, limit, window)])
+        return position is None, retry_after
+
+    def hit_all(self, hits):
+        """See MemoryLimiterStore.hit_all."""
+        import firebase_service as fb
+        client = fb.get_db()
+        if client is None:
+            return None, 0  # fail open: the datastore being down shouldn't lock everyone out
+
+        now = time.time()
+        # Hash the keys so raw IPs and usernames aren't stored as document ids
+        refs = [client.collection(self.COLLECTION).document(hashlib.sha256(key.encode()).hexdigest())
+                for key, _, _ in hits]
+        counts = {doc.id: doc.to_dict() or {} for doc in client.get_all(refs)}
+        batch = client.batch()
+        for position, ((key, limit, window), ref) in enumerate(zip(hits, refs)):
+            index = int(now // window)
+            elapsed = now - index * window
+            current, previous = (counts.get(ref.id, {}).get(str(i), 0) for i in (index, index - 1))
+            if previous * (1 - elapsed / window) + current + 1 > limit:
+                return position, self._retry_after(limit, window, elapsed, current + 1, previous)
+            batch.set(ref, {
+                str(index): fb.firestore.Increment(1),
+                str(index - 2): fb.firestore.DELETE_FIELD,
+                'expire_at': datetime.fromtimestamp((index + 2) * window, tz=timezone.utc),
+            }, merge=True)
+        if hits:
+            batch.commit()
+        return None, 0
+
+    @staticmethod
+    def _retry_after(limit, window, elapsed, current, previous):
+        if current > limit or not previous:
+            return window - elapsed
+        # When the previous window's weight has decayed enough
+        return max(window * (1 - (limit - current) / previous) - elapsed, 1)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    """The configured limiter store (RATE_LIMIT_STORE=memory|firestore).
+
+    Defaults to Firestore, so a limit holds across serverless instances;
+    the memory store is the default only in debug and testing.
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                local = has_app_context() and (current_app.debug or current_app.testing)
+                backend = os.getenv('RATE_LIMIT_STORE', 'memory' if local else 'firestore').lower()
+                _store = FirestoreLimiterStore() if backend == 'firestore' else MemoryLimiterStore()
+    return _store
+
+
+def check(endpoint, username=None):
+    """Count an attempt against every limit of `endpoint`.
+
+    Returns None if allowed, else the number of seconds to wait. Limits are
+    checked per username, then per IP, then globally; an attempt is counted
+    only if it is within all of them, so a flood that exhausts the global
+    limit doesn't use up each user's own.
+    """
+    keys = {
+        'user': username.strip().lower() if username else None,
+        'ip': request.remote_addr,
+        'global': '*',
+    }
+    scopes = [(scope, limit, window) for scope, (limit, window) in _limits(endpoint).items() if keys.get(scope)]
+    rejected, retry_after = get_store().hit_all(
+        [(f'{endpoint}:{scope}:{keys[scope]}', limit, window) for scope, limit, window in scopes])
+    for position, (scope, _, _) in enumerate(scopes[:None if rejected is None else rejected + 1]):
+        profiling.metrics.record_throttle(endpoint, scope, position != rejected)
+    if rejected is not None:
+        return max(math.ceil(retry_after), 1)
+    return None
+
+
+def throttle(endpoint, **error_fields):
+    """Reject requests over `endpoint`'s limits with 429 before the view runs.
+
+    The username is taken from the JSON body's "username". The JSON error
+    body is {**error_fields, 'message': ...}, matching the view's own errors.
+    """
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            if request.method != 'POST' or not current_app.config.get('RATE_LIMITING', True):
+                return f(*args, **kwargs)
+            username = (request.get_json(silent=True) or {}).get('username')
+            retry_after = check(endpoint, username if isinstance(username, str) else None)
+            if retry_after is None:
+                return f(*args, **kwargs)
+            minutes = math.ceil(retry_after / 60)
+            wait = f'{retry_after} seconds' if retry_after < 60 else f'{minutes} minute{"s" if minutes > 1 else ""}'
+            res = jsonify({**error_fields, 'message': f'Too many attempts. Try again in {wait}.'})
+            res.status_code = 429
+            res.headers['Retry-After'] = str(retry_after)
+            return res
+        return wrapper
+    return decorator
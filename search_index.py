@@ -0,0 +1,76 @@
+"""
+JMIConnect - Search index
+Tokenising and ranking for the per-section inverted index kept in
+Firestore by firebase_service (`search_terms/<section>:<token>`, one
+document per term mapping posting keys to weights). This module has no
+datastore access: it decides which terms an item contributes and how a
+query's postings are scored.
+"""
+import math
+import re
+from collections import defaultdict
+
+INDEXED = ('notes', 'announcements')
+
+# Field -> weight of one occurrence; titles count more than body text
+FIELDS = {
+    'notes': {'subject': 3, 'semester': 1, 'original_name': 1},
+    'announcements': {'title': 3, 'type': 2, 'subtitle': 1, 'description': 1},
+}
+PREFIX = {'notes': 'n', 'announcements': 'a'}
+KIND_OF = {v: k for k, v in PREFIX.items()}
+
+MAX_TERMS = 64  # per item; long descriptions keep their heaviest terms
+STOPWORDS = frozenset('''
+    a an and are as at be by for from has have in is it its of on or that the this to was were will with
+'''.split())
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    """Lower-cased word tokens of `text`, minus stopwords and single characters."""
+    return [t for t in _TOKEN.findall((text or '').lower())
+            if (len(t) > 1 or t.isdigit()) and t not in STOPWORDS]
+
+
+def posting_key(kind, doc_id):
+    # A plain identifier, so it can be used as a map field name in merges
+    return f'{PREFIX[kind]}_{doc_id}'
+
+
+def split_key(key):
+    """posting key -> (kind, document id)."""
+    prefix, doc_id = key.split('_', 1)
+    return KIND_OF[prefix], doc_id
+
+
+def terms_for(kind, item):
+    """{token: weight} an item contributes to the index."""
+    weights = defaultdict(int)
+    for field, boost in FIELDS[kind].items():
+        for token in tokenize(str(item.get(field) or '')):
+            weights[token] += boost
+    heaviest = sorted(weights.items(), key=lambda kv: kv[1], reverse=True)[:MAX_TERMS]
+    return dict(heaviest)
+
+
+def rank(query_tokens, postings, total_items, kinds=None):
+    """Score posting keys for a query.
+
+    `postings` maps each query token to its {posting key: weight}. Items
+    matching more of the query tokens come first, then by tf-idf score.
+    Returns [(key, score), ...] best first.
+    """
+    scores = defaultdict(float)
+    matched = defaultdict(int)
+    for token in query_tokens:
+        entries = postings.get(token) or {}
+        if not entries:
+            continue
+        idf = math.log(1 + max(total_items, len(entries)) / len(entries))
+        for key, weight in entries.items():
+            if kinds and split_key(key)[0] not in kinds:
+                continue
+            scores[key] += (1 + math.log(weight)) * idf
+            matched[key] += 1
+    return sorted(scores.items(), key=lambda kv: (matched[kv[0]], kv[1]), reverse=True)
@@ -0,0 +1,98 @@
+"""
+JMIConnect - Signed session tokens
+Stateless alternative to Firestore-backed sessions (SESSION_MODE=signed).
+The session identity (username, role, section, session id, generation and
+issue time) travels in an HMAC-signed cookie; profile fields stay in the
+user document. A token younger than SESSION_TOKEN_REFRESH seconds is
+accepted with no datastore read. An older one (still within
+SESSION_MAX_AGE) is revalidated with a single get_all of the user
+document and the revocation marker, then reissued with a fresh issue time.
+
+Revocation is not immediate:
+- logout writes a revoked_tokens/<session id> marker (and deny-lists the
+  token in this process);
+- "log out everywhere" bumps the user's `session_generation`, which is
+  compared with the generation inside each token.
+Other instances notice either within SESSION_TOKEN_REFRESH seconds, when
+the token is next revalidated. The instance that handled the logout
+rejects the token at once.
+"""
+import os
+import time
+
+from flask import current_app
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+import firebase_service as fb
+from cache import TTLCache
+
+SALT = 'jmiconnect-session'
+
+# Everything a request needs to authorise without loading the user
+FIELDS = ('session_id', 'username', 'role', 'section')
+REFRESH_INTERVAL = int(os.environ.get('SESSION_TOKEN_REFRESH', 900))
+
+# Revocations made by this process, so it doesn't wait for the next revalidation
+_denied = TTLCache(maxsize=10000, ttl=3600 * 24 * 7)
+_generations = TTLCache(maxsize=4096, ttl=REFRESH_INTERVAL)
+
+
+def _serializer():
+    return URLSafeTimedSerializer(current_app.config['SECRET_KEY'], salt=SALT)
+
+
+def _max_age():
+    return current_app.config.get('SESSION_MAX_AGE', 3600 * 24 * 7)
+
+
+def issue(session_data, generation=0):
+    """Sign the identity fields of session_data (session_id and username are required) into a cookie value."""
+    payload = {k: session_data[k] for k in FIELDS if session_data.get(k) is not None}
+    payload['iat'] = int(time.time())
+    payload['gen'] = generation
+    return _serializer().dumps(payload)
+
+
+def verify(token, on_reissue=None):
+    """Return the session payload for a valid, unrevoked token, else None.
+
+    A token due for revalidation costs one datastore call; if it is still
+    valid, on_reissue(new_token) is called with its replacement.
+    """
+    try:
+        payload = _serializer().loads(token, max_age=_max_age())
+    except BadSignature:
+        return None
+    if not isinstance(payload, dict) or 'username' not in payload or 'session_id' not in payload:
+        return None
+    if _denied.get(payload['session_id']):
+        return None
+    if payload.get('gen', 0) < (_generations.get(payload['username']) or 0):
+        return None
+    if time.time() - payload.get('iat', 0) < REFRESH_INTERVAL:
+        return payload
+
+    user, revoked = fb.get_token_state(payload['username'], payload['session_id'])
+    if user is None or revoked or payload.get('gen', 0) < user.get('session_generation', 0):
+        return None
+    # Pick up role or section changes made since the token was issued
+    payload = payload | {k: user[k] for k in ('role', 'section') if user.get(k) is not None}
+    if on_reissue:
+        on_reissue(issue(payload, user.get('session_generation', 0)))
+    return payload
+
+
+def revoke(token):
+    """Revoke a single token (logout on this device)."""
+    try:
+        payload = _serializer().loads(token, max_age=_max_age())
+    except BadSignature:
+        return
+    if isinstance(payload, dict) and payload.get('session_id'):
+        _denied.set(payload['session_id'], True, ttl=_max_age())
+        fb.revoke_session_token(payload['session_id'], _max_age())
+
+
+def revoke_all(username):
+    """Invalidate every token previously issued to `username`."""
+    _generations.set(username, fb.bump_session_generation(username))
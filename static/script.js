@@ -14,3 +14,37 @@ async function logout() {
         window.location.href = '/';
     }
 }
+
+// Realtime Database key of a user's chat thread: . $ # [ ] / and % are
+// %XX-escaped (must match chat_key in firebase_service.py).
+function chatKey(username) {
+    return username.replace(/[.$#\[\]\/%]/g, c => '%' + c.charCodeAt(0).toString(16).toUpperCase().padStart(2, '0'));
+}
+
+// Fetches the next page of a paginated list (?cursor=...&partial=1) and
+// appends the returned items to the element named by data-target.
+async function loadMore(button) {
+    button.disabled = true;
+    const url = new URL(window.location.href);
+    url.searchParams.set('cursor', button.dataset.cursor);
+    url.searchParams.set('partial', '1');
+    try {
+        const response = await fetch(url);
+        if (!response.ok) throw new Error(`HTTP ${response.status}`);
+
+        const target = document.getElementById(button.dataset.target);
+        target.insertAdjacentHTML('beforeend', await response.text());
+        target.dispatchEvent(new CustomEvent('items-appended'));
+
+        const next = response.headers.get('X-Next-Cursor');
+        if (next) {
+            button.dataset.cursor = next;
+            button.disabled = false;
+        } else {
+            button.parentElement.remove();
+        }
+    } catch (error) {
+        console.error('Error:', error);
+        button.disabled = false;
+    }
+}
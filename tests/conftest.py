@@ -0,0 +1,90 @@
+"""
+Shared fixtures: every test runs the real app against a fresh in-memory
+Firestore (benchmarks/fake_firestore.py), so datastore round trips and
+document reads can be asserted exactly.
+"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+os.environ.setdefault('FLASK_SECRET_KEY', 'test-secret')
+
+from werkzeug.security import generate_password_hash
+
+import firebase_service as fb
+import otp_service
+import rate_limit
+import session_tokens
+import utils
+from fake_firestore import FakeFirestore, module
+
+PASSWORD = 'test-password'
+# Cheap hash: the default iteration count makes every login take ~0.3 s
+PASSWORD_HASH = generate_password_hash(PASSWORD, method='pbkdf2:sha256:1000')
+
+
+@pytest.fixture
+def store():
+    client = FakeFirestore()
+    fb.set_db(client, module)
+    rate_limit._store = None
+    otp_service._store = None
+    session_tokens._denied.clear()
+    session_tokens._generations.clear()
+    yield client
+
+
+@pytest.fixture
+def app(store):
+    from app import app as flask_app
+    saved = dict(flask_app.config)
+    flask_app.config.update(TESTING=True, RATE_LIMITING=False, SESSION_MODE='firestore')
+    yield flask_app
+    flask_app.config.clear()
+    flask_app.config.update(saved)
+
+
+def add_user(client, username, role='student', section='A', **fields):
+    email = f'{username}@example.com'
+    client.collection('users').document(username).set({
+        'username': username, 'email': email, 'password': PASSWORD_HASH, 'role': role,
+        'section': section, 'branch': 'CSE', 'mobile': '9999999999', **fields})
+    client.collection(fb.EMAIL_INDEX).document(email).set({'username': username})
+
+
+@pytest.fixture
+def section(store):
+    """Section A with a CR, two students, 30 announcements and notes and 3 contacts."""
+    add_user(store, 'cr_a', role='cr')
+    for name in ('alice', 'bob'):
+        add_user(store, name)
+    for i in range(30):
+        fb.add_announcement({'title': f'Announcement {i}', 'type': 'announcement', 'subtitle': 'Announcement',
+                             'description': 'Exam schedule', 'date': f'2026-01-{1 + i % 28:02d}',
+                             'section': 'A', 'created_by': 'cr_a'})
+        fb.add_note({'subject': f'Subject {i % 5}', 'semester': str(1 + i % 8), 'download_url': 'https://example.com',
+                     'filename': 'Drive Link', 'original_name': 'External Resource',
+                     'date': f'2026-01-{1 + i % 28:02d}', 'section': 'A', 'uploaded_by': 'cr_a'})
+    for i in range(3):
+        fb.add_contact({'name': f'Contact {i}', 'role': 'Proctor', 'phone': '0110000000',
+                        'section': 'A', 'created_by': 'cr_a'})
+    fb.set_db(store)  # start every test with cold caches
+    return 'A'
+
+
+def login(app, username, password=PASSWORD):
+    client = app.test_client()
+    res = client.post('/auth/login', json={'username': username, 'password': password})
+    assert res.status_code == 200, res.get_json()
+    return client
+
+
+@pytest.fixture
+def reset_counts():
+    for key in utils.lookup_counts:
+        utils.lookup_counts[key] = 0
+    return utils.lookup_counts
@@ -0,0 +1,45 @@
+import io
+
+import pytest
+
+import bulk_io
+import firebase_service as fb
+from conftest import login
+
+
+def _clean(kind, rows):
+    errors = bulk_io.ImportErrors()
+    docs = [doc for _, doc in bulk_io.clean_rows(kind, enumerate(rows, start=2), 'A', 'cr_a', errors)]
+    return docs, errors
+
+
+def test_usernames_must_be_database_keys():
+    rows = [{'username': name, 'email': f'{i}@example.com'}
+            for i, name in enumerate(['good_name-1', 'first.last', 'a$b', 'x#y', 'p[q]'])]
+    docs, errors = _clean('users', rows)
+    assert [doc['username'] for doc in docs] == ['good_name-1']
+    assert errors.total == 4
+
+
+def test_rows_that_are_not_utf8_are_reported(app, section, store):
+    client = login(app, 'cr_a')
+    body = b'name,phone\n' + b''.join(b'Contact %d,011\n' % i for i in range(600)) + b'Ren\xe9,022\n'
+    res = client.post('/cr/import', data={'kind': 'contacts', 'file': (io.BytesIO(body), 'contacts.csv')},
+                      headers={'Accept': 'application/json'})
+    assert res.status_code == 200
+    assert res.get_json()['imported'] == 600
+    assert [line for line, _ in res.get_json()['errors']] == [602]
+    assert len(fb.get_contacts('A')) == 603
+
+
+def test_rows_committed_before_a_failure_are_published(section, store):
+    def rows():
+        for i in range(fb.BATCH_LIMIT):
+            yield {'name': f'Contact {i}', 'phone': '011'}
+        raise RuntimeError('upload interrupted')
+
+    version = fb.content_version('contacts', 'A')
+    with pytest.raises(RuntimeError):
+        fb.import_content('contacts', 'A', rows())
+    assert fb.content_version('contacts', 'A') == version + 1
+    assert len(fb.get_contacts('A')) == 3 + fb.BATCH_LIMIT
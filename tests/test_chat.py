@@ -0,0 +1,8 @@
+import firebase_service as fb
+
+
+def test_chat_keys_are_valid_database_keys():
+    assert fb.chat_key('student_01') == 'student_01'
+    key = fb.chat_key('first.last$#[x]/50%')
+    assert not set('.$#[]/') & set(key)
+    assert fb._chat_student(key) == 'first.last$#[x]/50%'
@@ -0,0 +1,69 @@
+import firebase_service as fb
+from conftest import login
+
+
+def test_unchanged_page_revalidates_with_304(app, section):
+    client = login(app, 'alice')
+    first = client.get('/notes')
+    assert first.status_code == 200 and first.headers['ETag'].startswith('W/')
+
+    again = client.get('/notes', headers={'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304
+    assert again.headers['ETag'] == first.headers['ETag']
+
+
+def test_write_changes_etag(app, section):
+    client = login(app, 'alice')
+    etag = client.get('/announcements').headers['ETag']
+    fb.add_announcement({'title': 'Fresh notice', 'type': 'announcement', 'subtitle': 'Announcement',
+                         'description': 'New', 'date': '2026-12-31', 'section': 'A', 'created_by': 'cr_a'})
+
+    res = client.get('/announcements', headers={'If-None-Match': etag})
+    assert res.status_code == 200
+    assert res.headers['ETag'] != etag
+    assert b'Fresh notice' in res.data
+
+
+def _write_on_other_instance(monkeypatch, write):
+    """Run `write` without touching this instance's caches, as another instance would."""
+    with monkeypatch.context() as m:
+        for cache in (fb.content_cache, fb.version_cache, fb.count_cache, fb.search_cache):
+            m.setattr(cache, 'invalidate', lambda *a, **k: None)
+            m.setattr(cache, 'invalidate_keys', lambda *a, **k: None)
+        write()
+
+
+def test_body_and_etag_agree_across_instances(app, section, monkeypatch):
+    client = login(app, 'alice')
+    first = client.get('/announcements')
+    _write_on_other_instance(monkeypatch, lambda: fb.add_announcement({
+        'title': 'Remote notice', 'type': 'announcement', 'subtitle': 'Announcement', 'description': 'New',
+        'date': '2026-12-31', 'section': 'A', 'created_by': 'cr_a'}))
+
+    # Until this instance's version cache expires, it serves the old page under the old ETag
+    cached = client.get('/announcements')
+    assert cached.headers['ETag'] == first.headers['ETag'] and b'Remote notice' not in cached.data
+
+    fb.version_cache.clear()
+    res = client.get('/announcements', headers={'If-None-Match': first.headers['ETag']})
+    assert res.status_code == 200 and res.headers['ETag'] != first.headers['ETag']
+    assert b'Remote notice' in res.data
+
+
+def test_dashboard_counts_follow_version(app, section, monkeypatch):
+    client = login(app, 'cr_a')
+    first = client.get('/cr/dashboard')
+    assert b'>30<' in first.data.replace(b' ', b'').replace(b'\n', b'')
+    _write_on_other_instance(monkeypatch, lambda: fb.add_contact({
+        'name': 'Remote', 'role': 'Proctor', 'phone': '0110000000', 'section': 'A', 'created_by': 'cr_a'}))
+
+    fb.version_cache.clear()
+    assert fb.get_section_counts('A')['contacts'] == 4
+
+
+def test_failed_count_is_not_revalidated(app, section, monkeypatch):
+    client = login(app, 'cr_a')
+    monkeypatch.setattr(fb, '_count', lambda kind, section: None if kind == 'notes' else 1)
+    res = client.get('/cr/dashboard')
+    assert res.status_code == 200
+    assert 'ETag' not in res.headers and res.headers['Cache-Control'] == 'no-store'
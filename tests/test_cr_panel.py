@@ -0,0 +1,31 @@
+import firebase_service as fb
+from conftest import add_user, login
+
+
+def test_cr_cannot_delete_another_sections_item(app, section, store):
+    add_user(store, 'cr_b', role='cr', section='B')
+    doc = next(iter(store.collection('announcements').stream()))
+    client = login(app, 'cr_b')
+    store.rpcs.clear()
+
+    client.post(f'/cr/announcements/delete/{doc.id}')
+    assert store.collection('announcements').document(doc.id).get().exists
+    assert store.rpcs['commit'] == 0
+
+
+def test_deleting_a_missing_item_writes_nothing(app, section, store):
+    client = login(app, 'cr_a')
+    versions = store.collection(fb.CONTENT_VERSIONS).document('A').get().to_dict()
+
+    client.post('/cr/contacts/delete/no-such-id')
+    assert not store.collection(fb.TOMBSTONES).document('contacts_no-such-id').get().exists
+    assert store.collection(fb.CONTENT_VERSIONS).document('A').get().to_dict() == versions
+    assert fb.get_section_counts('A')['contacts'] == 3
+
+
+def test_own_delete_leaves_a_tombstone(app, section, store):
+    doc = next(iter(store.collection('contacts').stream()))
+    login(app, 'cr_a').post(f'/cr/contacts/delete/{doc.id}')
+    assert not store.collection('contacts').document(doc.id).get().exists
+    assert store.collection(fb.TOMBSTONES).document(f'contacts_{doc.id}').get().exists
+    assert fb.get_section_counts('A')['contacts'] == 2
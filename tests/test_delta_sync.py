@@ -0,0 +1,84 @@
+import time
+from datetime import datetime, timezone
+
+import firebase_service as fb
+from conftest import login
+
+
+def _sync(client, kind, since, limit=20):
+    items, deleted = {}, set()
+    while True:
+        body = client.get(f'/api/v1/{kind}?since={since}&limit={limit}').get_json()
+        items.update({item['id']: item for item in body['items']})
+        deleted.update(body['deleted'])
+        since = body['since']
+        if not body['has_more']:
+            return items, deleted, since
+
+
+def test_bulk_import_syncs_completely(app, section):
+    client = login(app, 'alice')
+    token = client.get('/api/v1/notes').get_json()['since']
+    rows = [{'subject': f'Imported {i}', 'semester': '3', 'download_url': 'https://example.com',
+             'date': '2026-02-01'} for i in range(50)]
+    assert fb.import_content('notes', 'A', rows) == 50
+
+    items, deleted, token = _sync(client, 'notes', token)
+    assert sum(item['subject'].startswith('Imported') for item in items.values()) == 50
+
+    items, deleted, _ = _sync(client, 'notes', token)
+    assert not items and not deleted
+
+
+def test_sync_reports_deletions(app, section, store):
+    client = login(app, 'alice')
+    _, _, token = _sync(client, 'announcements', 0)
+    doc = next(iter(store.collection('announcements').stream()))
+    fb.delete_announcement(doc.id, 'A')
+
+    items, deleted, _ = _sync(client, 'announcements', token)
+    assert deleted == {doc.id} and not items
+
+
+def test_backfill_makes_old_items_visible(app, section, store):
+    store.collection('contacts').document('legacy').set({'name': 'Old', 'section': 'A'})
+    client = login(app, 'alice')
+    assert 'legacy' not in _sync(client, 'contacts', 0)[0]
+
+    assert fb.backfill_updated_at() == 1
+    fb.set_db(store)
+    assert 'legacy' in _sync(client, 'contacts', 0)[0]
+
+
+def test_malformed_token_is_rejected(app, section):
+    client = login(app, 'alice')
+    assert client.get('/api/v1/notes?since=not-a-token').status_code == 400
+
+
+def test_deletions_are_paged(app, section, store):
+    client = login(app, 'alice')
+    _, _, token = _sync(client, 'notes', 0)
+    ids = [doc.id for doc in store.collection('notes').stream()][:12]
+    for doc_id in ids:
+        fb.delete_note(doc_id, 'A')
+
+    pages = []
+    while True:
+        body = client.get(f'/api/v1/notes?since={token}&limit=5').get_json()
+        pages.append(body['deleted'])
+        token = body['since']
+        if not body['has_more']:
+            break
+    assert [len(page) for page in pages] == [5, 5, 2]
+    assert sorted(sum(pages, [])) == sorted(ids)
+
+
+def test_tombstones_expire_and_old_tokens_are_refused(app, section, store):
+    doc = next(iter(store.collection('notes').stream()))
+    fb.delete_note(doc.id, 'A')
+    tombstone = store.collection(fb.TOMBSTONES).document(f'notes_{doc.id}').get().to_dict()
+    assert tombstone['expire_at'] > datetime.now(timezone.utc)
+
+    client = login(app, 'alice')
+    old = int(time.time() - fb.TOMBSTONE_TTL - 60) * 1000
+    assert client.get(f'/api/v1/notes?since={old}').status_code == 410
@@ -0,0 +1,38 @@
+import firebase_service as fb
+
+
+def _titles(section):
+    items, _ = fb.get_page('announcements', section)
+    return [item['title'] for item in items]
+
+
+def _post(title):
+    fb.add_announcement({'title': title, 'type': 'announcement', 'description': 'Late change',
+                         'date': '2026-02-01', 'section': 'A', 'created_by': 'cr_a'})
+
+
+def test_first_page_is_served_from_the_digest(section, store):
+    store.reads = 0
+    assert len(_titles('A')) == fb.PAGE_SIZE
+    assert store.reads == 2  # the content version and the digest
+
+
+def test_a_rebuild_landing_after_a_newer_write_is_ignored(section, store):
+    digest = store.collection(fb.SECTION_DIGESTS).document('A')
+    _post('Writer A')
+    stale = digest.get().to_dict()['announcements']
+    _post('Writer B')
+    # Writer A's rebuild, built before B committed, is written last
+    digest.update({'announcements': stale})
+
+    fb.set_db(store)  # another instance, with cold caches
+    assert {'Writer A', 'Writer B'} <= set(_titles('A'))
+
+
+def test_rebuilt_digest_is_used_again(section, store):
+    _post('Writer A')
+    fb.rebuild_section_digests('A')
+    fb.set_db(store)
+    store.reads = 0
+    assert 'Writer A' in _titles('A')
+    assert store.reads == 2
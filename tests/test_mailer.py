@@ -0,0 +1,60 @@
+import smtplib
+import time
+
+import mailer
+
+
+class FlakyMailer(mailer.Mailer):
+    def __init__(self, **kwargs):
+        super().__init__('localhost', 0, username='noreply@example.com', max_retries=1, **kwargs)
+        self.fail = True
+
+    def _send(self, msg):
+        if self.fail:
+            raise smtplib.SMTPException('relay down')
+
+
+def _message():
+    return mailer.build_message('password_changed', 'alice@example.com', 'noreply@example.com',
+                                username='alice', changed_at='now')
+
+
+def test_inline_failure_is_reported_and_recorded():
+    m = FlakyMailer(send_async=False)
+    message_id = m.enqueue(_message())
+    assert m.status(message_id)['state'] == mailer.FAILED
+    stats = m.stats()
+    assert stats['failed'] == 1 and stats['failing']
+    assert stats['last_failure']['to'] == 'alice@example.com'
+
+    m.fail = False
+    m.enqueue(_message())
+    assert not m.stats()['failing']
+
+
+def test_sends_inline_on_vercel(monkeypatch):
+    monkeypatch.setenv('JMI_EMAIL', 'noreply@example.com')
+    monkeypatch.setenv('VERCEL', '1')
+    monkeypatch.delenv('MAIL_ASYNC', raising=False)
+    monkeypatch.setattr(mailer, '_mailer', None)
+    assert mailer.get_mailer().send_async is False
+
+
+class SlowSMTP:
+    def send_message(self, msg):
+        time.sleep(0.5)
+
+    def quit(self):
+        pass
+
+
+def test_enqueue_does_not_wait_for_a_send_in_progress():
+    m = mailer.Mailer('localhost', 0)
+    m._connect = SlowSMTP
+    m.enqueue(_message())
+    time.sleep(0.05)  # the worker is now sending
+
+    started = time.monotonic()
+    m.enqueue(_message())
+    assert time.monotonic() - started < 0.1
+    assert m.flush(timeout=5) and m.sent == 2
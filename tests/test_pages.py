@@ -0,0 +1,36 @@
+import re
+
+from conftest import login
+
+
+def _semesters(html):
+    return re.findall(r'data-semester="(\w+)"', html)
+
+
+def test_semester_filter_pages_on_the_server(app, section, store):
+    client = login(app, 'alice')
+    for i in range(30):
+        store.collection('notes').document(f'extra{i}').set({
+            'subject': 'Extra', 'semester': '3', 'date': '2025-01-01', 'section': 'A'})
+
+    res = client.get('/notes?semester=3')
+    assert res.status_code == 200
+    first = _semesters(res.get_data(as_text=True))
+    assert len(first) == 20 and set(first) == {'3'}
+
+    cursor = re.search(r'data-cursor="([^"]+)"', res.get_data(as_text=True)).group(1)
+    more = client.get(f'/notes?semester=3&cursor={cursor}&partial=1')
+    assert set(_semesters(more.get_data(as_text=True))) == {'3'}
+    # 4 semester-3 notes from the fixture plus 30 extra
+    assert len(first) + len(_semesters(more.get_data(as_text=True))) == 34
+
+
+def test_unknown_semester_is_rejected(app, section):
+    client = login(app, 'alice')
+    assert client.get('/notes?semester=nine').status_code == 400
+
+
+def test_api_semester_filter(app, section):
+    client = login(app, 'alice')
+    items = client.get('/api/v1/notes?semester=2&limit=100').get_json()['items']
+    assert items and {item['semester'] for item in items} == {'2'}
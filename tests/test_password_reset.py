@@ -0,0 +1,26 @@
+import otp_service
+from conftest import login
+
+
+def test_reset_flow_stores_only_a_hash(app, section, monkeypatch):
+    monkeypatch.setattr(otp_service, 'generate_otp', lambda: '123456')
+    monkeypatch.setattr(otp_service, 'send_otp_email', lambda *a: (True, 'OTP sent successfully'))
+    client = app.test_client()
+    assert client.post('/password-reset/request', json={'username': 'alice'}).status_code == 200
+
+    record = otp_service.get_store().get('alice')
+    assert 'otp' not in record and '123456' not in str(record)
+
+    assert client.post('/password-reset/verify', json={'username': 'alice', 'otp': '654321'}).status_code == 400
+    assert client.post('/password-reset/verify', json={'username': 'alice', 'otp': '123456'}).status_code == 200
+    res = client.post('/password-reset/reset', json={
+        'username': 'alice', 'new_password': 'new-password', 'confirm_password': 'new-password'})
+    assert res.status_code == 200
+    login(app, 'alice', 'new-password')
+
+
+def test_firestore_store_is_the_default_outside_debug(app, monkeypatch):
+    monkeypatch.delenv('OTP_STORE', raising=False)
+    app.config['TESTING'] = False
+    with app.app_context():
+        assert isinstance(otp_service.get_store(), otp_service.FirestoreOTPStore)
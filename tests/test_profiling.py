@@ -0,0 +1,34 @@
+import json
+import logging
+
+from flask import Flask
+
+import firebase_service as fb
+import profiling
+from conftest import login
+
+
+def test_cached_calls_count_as_calls_not_reads(app, section, monkeypatch):
+    login(app, 'alice').get('/notes')  # warms the digest
+    monkeypatch.setattr(profiling, 'enabled', True)
+    profile = profiling.Profile()
+    token = profiling._current.set(profile)
+    try:
+        fb.get_page('notes', 'A')
+    finally:
+        profiling._current.reset(token)
+    assert profile.service_calls >= 1 and profile.reads == 0
+
+
+def test_request_log_line_goes_to_the_logger(monkeypatch, caplog):
+    monkeypatch.setattr(profiling, 'enabled', False)
+    app = Flask(__name__)
+    app.config['PROFILING'] = True
+    profiling.init_app(app)
+    app.add_url_rule('/ping', 'ping', lambda: 'pong')
+
+    with caplog.at_level(logging.INFO, logger='jmiconnect.requests'):
+        res = app.test_client().get('/ping')
+    assert res.headers['Server-Timing'].startswith('service;')
+    (record,) = [r for r in caplog.records if r.name == 'jmiconnect.requests']
+    assert json.loads(record.getMessage())['endpoint'] == 'ping'
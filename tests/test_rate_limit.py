@@ -0,0 +1,61 @@
+import rate_limit
+from conftest import PASSWORD, login
+
+
+def test_login_is_throttled_per_user(app, section, monkeypatch):
+    app.config['RATE_LIMITING'] = True
+    monkeypatch.setitem(rate_limit.DEFAULT_LIMITS, 'login', {'user': (3, 900)})
+    client = app.test_client()
+    for _ in range(3):
+        assert client.post('/auth/login', json={'username': 'alice', 'password': 'wrong'}).status_code == 401
+
+    res = client.post('/auth/login', json={'username': 'alice', 'password': PASSWORD})
+    assert res.status_code == 429
+    assert int(res.headers['Retry-After']) > 0
+    # Other users are unaffected
+    login(app, 'bob')
+
+
+def test_memory_store_only_counts_allowed_hits():
+    store = rate_limit.MemoryLimiterStore()
+    results = [store.hit('k', 2, 60)[0] for _ in range(5)]
+    assert results == [True, True, False, False, False]
+    assert len(store._hits['k'][1]) == 2
+
+
+def _firestore_attempts(n, limit=2):
+    store = rate_limit.FirestoreLimiterStore()
+    return [store.hit_all([('login:user:alice', limit, 60), ('login:ip:1.2.3.4', 10, 60)]) for _ in range(n)]
+
+
+def test_firestore_store_counts_only_allowed_hits(store):
+    results = _firestore_attempts(5)
+    assert [position for position, _ in results] == [None, None, 0, 0, 0]
+    # The IP limit saw only the two allowed attempts
+    counts = [doc.to_dict() for doc in store.collection('rate_limits').stream()]
+    assert sorted(sum(v for k, v in c.items() if k.isdigit()) for c in counts) == [2, 2]
+
+
+def test_firestore_store_reads_all_keys_in_one_rpc(store):
+    store.rpcs.clear()
+    _firestore_attempts(1)
+    assert store.rpcs['get'] == 1 and store.rpcs['commit'] == 1 and store.total_rpcs() == 2
+
+
+def _flood(limiter):
+    hits = [('login:user:alice', 5, 60), ('login:global:*', 2, 60)]
+    return [limiter.hit_all(hits)[0] for _ in range(5)]
+
+
+def test_rejected_attempts_use_up_no_limit(store):
+    for limiter in (rate_limit.MemoryLimiterStore(), rate_limit.FirestoreLimiterStore()):
+        assert _flood(limiter) == [None, None, 1, 1, 1]
+        # alice's own limit saw only the two allowed attempts
+        assert [limiter.hit('login:user:alice', 3, 60)[0] for _ in range(2)] == [True, False]
+
+
+def test_firestore_store_is_the_default_outside_debug(app, monkeypatch):
+    monkeypatch.delenv('RATE_LIMIT_STORE', raising=False)
+    app.config['TESTING'] = False
+    with app.app_context():
+        assert isinstance(rate_limit.get_store(), rate_limit.FirestoreLimiterStore)
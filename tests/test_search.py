@@ -0,0 +1,45 @@
+import firebase_service as fb
+from conftest import login
+from test_conditional import _write_on_other_instance
+
+
+def _post(title, description='Details inside'):
+    return fb.add_announcement({'title': title, 'type': 'announcement', 'subtitle': 'Announcement',
+                                'description': description, 'date': '2026-12-31', 'section': 'A',
+                                'created_by': 'cr_a'})
+
+
+def _titles(query):
+    items, _ = fb.search('A', query)
+    return [item.get('title') or item.get('subject') for item in items]
+
+
+def test_adds_and_deletes_update_the_index(section, store):
+    item_id = _post('Robotics workshop')
+    assert _titles('robotics') == ['Robotics workshop']
+
+    fb.delete_announcement(item_id, 'A')
+    assert _titles('robotics') == []
+    postings = store.collection(fb.SEARCH_TERMS).document('A:robotics').get().to_dict()['postings']
+    assert postings == {}
+
+
+def test_title_matches_rank_above_body_matches(section):
+    _post('Lab timings', 'Bring the hackathon form')
+    _post('Hackathon registration')
+    assert _titles('hackathon') == ['Hackathon registration', 'Lab timings']
+    # Matching more query terms beats a heavier single match
+    assert _titles('hackathon form')[0] == 'Lab timings'
+
+
+def test_search_page_follows_writes_on_other_instances(app, section, monkeypatch):
+    client = login(app, 'alice')
+    first = client.get('/search?q=notice')
+    _write_on_other_instance(monkeypatch, lambda: _post('Remote notice'))
+
+    fb.version_cache.clear()
+    res = client.get('/search?q=notice', headers={'If-None-Match': first.headers['ETag']})
+    assert res.status_code == 200 and res.headers['ETag'] != first.headers['ETag']
+    assert b'Remote notice' in res.data
+    again = client.get('/search?q=notice', headers={'If-None-Match': res.headers['ETag']})
+    assert again.status_code == 304
@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta, timezone
+
+import firebase_service as fb
+from conftest import login
+
+
+def _session_ref(store):
+    (doc,) = list(store.collection(fb.SESSIONS).stream())
+    return doc.reference
+
+
+def test_session_and_user_resolved_once_per_request(app, section, reset_counts):
+    client = login(app, 'cr_a')
+    reset_counts.update(session=0, user=0)
+    assert client.get('/cr/dashboard').status_code == 200
+    assert reset_counts == {'session': 1, 'user': 1}
+
+
+def test_warm_page_view_makes_no_datastore_calls(app, section, store):
+    client = login(app, 'alice')
+    client.get('/notes')
+    store.rpcs.clear()
+    assert client.get('/notes').status_code == 200
+    assert store.total_rpcs() == 0
+
+
+def test_login_sets_expiry(app, section, store):
+    login(app, 'alice')
+    expires = _session_ref(store).get().get('expires_at')
+    assert timedelta(days=6, hours=23) < expires - datetime.now(timezone.utc) <= timedelta(days=7)
+
+
+def test_expired_session_is_rejected_and_deleted(app, section, store):
+    client = login(app, 'alice')
+    ref = _session_ref(store)
+    ref.update({'expires_at': datetime.now(timezone.utc) - timedelta(seconds=1)})
+    fb.session_cache.clear()
+
+    res = client.get('/notes')
+    assert res.status_code == 302
+    assert not ref.get().exists
+
+
+def test_renewal_is_throttled(app, section, store):
+    client = login(app, 'alice')
+    ref = _session_ref(store)
+    ref.update({'expires_at': datetime.now(timezone.utc) + timedelta(days=2)})
+    fb.session_cache.clear()
+
+    res = client.get('/notes')
+    assert any(c.startswith('session_id=') for c in res.headers.getlist('Set-Cookie'))
+    assert ref.get().get('expires_at') - datetime.now(timezone.utc) > timedelta(days=6)
+
+    fb.session_cache.clear()
+    store.rpcs.clear()
+    res = client.get('/notes')
+    assert store.rpcs['write'] == 0 and store.rpcs['commit'] == 0
+    assert not res.headers.getlist('Set-Cookie')
+
+
+def test_purge_removes_only_expired_sessions(app, section, store):
+    now = datetime.now(timezone.utc)
+    for i in range(7):
+        store.collection(fb.SESSIONS).document(f'old{i}').set(
+            {'session_id': f'old{i}', 'username': 'alice', 'expires_at': now - timedelta(hours=1)})
+    login(app, 'alice')
+    assert fb.purge_expired_sessions(page_size=3) == 7
+    assert len(list(store.collection(fb.SESSIONS).stream())) == 1
+
+
+def test_purge_reads_only_expired_sessions(app, section, store):
+    for name in ('alice', 'bob'):
+        login(app, name)
+    store.reads = 0
+    assert fb.purge_expired_sessions() == 0
+    assert store.reads <= 2  # an empty query result bills one read per collection
+
+
+def test_backfilled_old_sessions_are_purged(app, section, store):
+    old = (datetime.now() - timedelta(days=8)).isoformat()
+    store.collection(fb.SESSIONS).document('pre').set({'session_id': 'pre', 'username': 'alice', 'timestamp': old})
+    assert fb.backfill_session_expiry() == 1
+    assert fb.purge_expired_sessions() == 1
+
+
+def test_malformed_session_cookie_is_ignored(app, section, store):
+    client = app.test_client()
+    client.set_cookie('session_id', 'a/b')
+    store.rpcs.clear()
+    assert client.get('/').status_code == 200
+    assert store.total_rpcs() == 0
+    assert client.get('/auth/logout').status_code == 200
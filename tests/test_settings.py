@@ -0,0 +1,44 @@
+import uuid
+from datetime import datetime
+
+import firebase_service as fb
+from conftest import login
+
+
+def _save(client, **form):
+    return client.post('/auth/settings', data={'email': 'alice@example.com', 'mobile': '9999999999', **form})
+
+
+def test_unchanged_form_writes_nothing(app, section, store):
+    client = login(app, 'alice')  # the session has profile_pic '' while the user has none
+    store.rpcs.clear()
+    assert _save(client).status_code == 302
+    assert store.rpcs['commit'] == 0 and store.rpcs['write'] == 0
+
+
+def test_changed_mobile_updates_user_and_session_in_one_commit(app, section, store):
+    client = login(app, 'alice')
+    store.rpcs.clear()
+    _save(client, mobile='8888888888')
+    assert store.rpcs['commit'] == 1
+    assert store.collection('users').document('alice').get().get('mobile') == '8888888888'
+    (session,) = [doc.to_dict() for doc in store.collection(fb.SESSIONS).stream()]
+    assert session['mobile'] == '8888888888'
+
+
+def test_legacy_session_is_rewritten(app, section, store):
+    session_id = str(uuid.uuid4())
+    store.collection(fb.LEGACY_SESSIONS).document('alice').set({
+        'session_id': session_id, 'username': 'alice', 'email': 'alice@example.com', 'section': 'A',
+        'role': 'student', 'mobile': '9999999999', 'timestamp': datetime.now().isoformat()})
+    client = app.test_client()
+    client.set_cookie('session_id', session_id)
+    _save(client, mobile='7777777777')
+    assert store.collection('users').document('alice').get().get('mobile') == '7777777777'
+    assert store.collection(fb.SESSIONS).document(session_id).get().get('mobile') == '7777777777'
+
+
+def test_changed_fields_treats_blank_as_missing():
+    assert fb.changed_fields({'profile_pic': ''}, {'profile_pic': None}) == {}
+    assert fb.changed_fields({}, {'mobile': ''}) == {}
+    assert fb.changed_fields({'mobile': '1'}, {'mobile': '2'}) == {'mobile': '2'}
@@ -0,0 +1,60 @@
+import pytest
+
+import session_tokens
+from conftest import login
+
+
+@pytest.fixture
+def signed(app):
+    app.config['SESSION_MODE'] = 'signed'
+    return app
+
+
+def _payload(app, res):
+    (cookie,) = [c for c in res.headers.getlist('Set-Cookie') if c.startswith('session_id=')]
+    with app.app_context():
+        return session_tokens._serializer().loads(cookie.split(';')[0].split('=', 1)[1])
+
+
+def test_token_carries_identity_only(signed, section):
+    res = signed.test_client().post('/auth/login', json={'username': 'alice', 'password': 'test-password'})
+    payload = _payload(signed, res)
+    assert set(payload) == {'session_id', 'username', 'role', 'section', 'iat', 'gen'}
+
+
+def test_fresh_token_needs_no_datastore_call(signed, section, store):
+    client = login(signed, 'alice')
+    store.rpcs.clear()
+    assert client.get('/auth/session').status_code == 200
+    assert store.total_rpcs() == 0
+
+
+def test_old_token_is_revalidated_and_reissued(signed, section, store, monkeypatch):
+    client = login(signed, 'alice')
+    monkeypatch.setattr(session_tokens, 'REFRESH_INTERVAL', 0)
+    store.rpcs.clear()
+    res = client.get('/auth/session')
+    assert res.status_code == 200 and store.rpcs['get'] == 1
+    assert _payload(signed, res)['username'] == 'alice'
+
+
+def test_logout_everywhere_reaches_other_instances_on_revalidation(signed, section, monkeypatch):
+    client = login(signed, 'alice')
+    other = login(signed, 'alice')
+    assert other.post('/auth/logout-all').status_code == 200
+    session_tokens._generations.clear()  # as on an instance that didn't handle the logout
+
+    assert client.get('/auth/session').status_code == 200  # until the token is due for revalidation
+    monkeypatch.setattr(session_tokens, 'REFRESH_INTERVAL', 0)
+    assert client.get('/auth/session').status_code == 401
+
+
+def test_logout_revokes_the_token(signed, section, monkeypatch):
+    client = login(signed, 'alice')
+    token = client.get_cookie('session_id').value
+    client.get('/auth/logout')
+    session_tokens._denied.clear()
+
+    client.set_cookie('session_id', token)
+    monkeypatch.setattr(session_tokens, 'REFRESH_INTERVAL', 0)
+    assert client.get('/auth/session').status_code == 401
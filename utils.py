@@ -2,13 +2,192 @@
 JMIConnect - Shared Utilities
 Common helper functions used across multiple blueprints.
 """
-from flask import request
+import gzip
+import hashlib
+import json
+from email.utils import formatdate
+from functools import wraps
+
+from flask import request, g, current_app, make_response, render_template, abort, session
 import firebase_service as fb
+import session_tokens
+
+# How many times the session / user document has actually been resolved
+# (as opposed to served from flask.g). Tests can reset these and assert one
+# resolution per request.
+lookup_counts = {'session': 0, 'user': 0}
+
+
+def signed_sessions():
+    """True when sessions are stateless signed cookies (SESSION_MODE=signed)."""
+    return current_app.config.get('SESSION_MODE') == 'signed'
 
 
 def get_current_user():
-    """Get the currently logged-in user from session cookie."""
-    session_id = request.cookies.get('session_id')
-    if not session_id:
-        return None
-    return fb.get_session(session_id)
+    """Get the currently logged-in user from session cookie.
+
+    Resolved once per request and kept on flask.g, so decorators and views
+    can call this freely without repeating the Firestore lookup.
+    """
+    if 'current_user' not in g:
+        session_id = request.cookies.get('session_id')
+        user = None
+        if session_id:
+            lookup_counts['session'] += 1
+            if signed_sessions():
+                user = session_tokens.verify(session_id, on_reissue=lambda token: setattr(g, 'session_cookie', token))
+            else:
+                user = fb.get_session(session_id, current_app.config['SESSION_MAX_AGE'],
+                                      on_renew=lambda: setattr(g, 'session_cookie', session_id))
+        g.current_user = user
+    return g.current_user
+
+
+def get_current_account():
+    """Get the full user document for the logged-in user (once per request)."""
+    if 'current_account' not in g:
+        user = get_current_user()
+        account = None
+        if user:
+            lookup_counts['user'] += 1
+            account = fb.get_user(user['username'])
+        g.current_account = account
+    return g.current_account
+
+
+def set_current_user(user):
+    """Replace the request's cached identity (after login, logout or a profile save)."""
+    g.current_user = user
+    g.pop('current_account', None)
+
+
+def save_session(session_data, generation=0):
+    """Store a session in the configured mode and return the cookie value for it."""
+    if signed_sessions():
+        return session_tokens.issue(session_data, generation)
+    fb.create_session(session_data, current_app.config['SESSION_MAX_AGE'])
+    return session_data['session_id']
+
+
+def refresh_session_cookie(res):
+    """after_request: re-send the cookie of a session renewed (or token reissued) during this request."""
+    if g.get('session_cookie') and g.get('current_user') and not any(
+            c.startswith('session_id=') for c in res.headers.getlist('Set-Cookie')):
+        res.set_cookie('session_id', g.session_cookie, httponly=True,
+                       max_age=current_app.config['SESSION_MAX_AGE'])
+    return res
+
+
+def end_session(cookie_value, username=None):
+    """Revoke the session identified by a session cookie."""
+    if signed_sessions():
+        session_tokens.revoke(cookie_value)
+    else:
+        fb.delete_session(cookie_value, username)
+
+
+def render_paged(template, partial, name, items, next_cursor, **context):
+    """Render a paginated list page, or just the next batch of items.
+
+    "Load more" requests (?partial=1) get only the item markup, with the
+    following page's cursor in the X-Next-Cursor header.
+    """
+    if request.args.get('partial'):
+        res = make_response(render_template(partial, **{name: items}, **context))
+        if next_cursor:
+            res.headers['X-Next-Cursor'] = next_cursor
+        return res
+    return render_template(template, next_cursor=next_cursor, **{name: items}, **context)
+
+
+def get_page_or_400(kind, section, **filters):
+    """fb.get_page() for the request's ?cursor=, rejecting malformed cursors."""
+    try:
+        return fb.get_page(kind, section, cursor=request.args.get('cursor'), **filters)
+    except ValueError:
+        abort(400)
+
+
+def content_etag(user, kinds):
+    """Weak ETag for a page showing the user's section `kinds` content.
+
+    Covers everything a section page is rendered from: the content versions,
+    the viewer's session (name, role, ...), the exact URL (cursor, partial)
+    and the deployed release.
+    """
+    versions = fb.get_content_versions(user['section'])
+    key = json.dumps([current_app.config.get('RELEASE'), request.full_path, user,
+                      [versions[kind][0] for kind in kinds]], sort_keys=True, default=str)
+    return hashlib.sha1(key.encode()).hexdigest(), versions
+
+
+def skip_etag():
+    """Send the current page without an ETag (see conditional)."""
+    g.skip_etag = True
+
+
+def conditional(*kinds):
+    """Answer GETs with 304 Not Modified while the section's `kinds` are unchanged.
+
+    The check runs before the view, so a revalidated page costs no content
+    reads and no template rendering. Pages are per-user, hence
+    "private, no-cache": browsers keep them but revalidate on every visit,
+    and shared caches don't store them. Place below any access-check
+    decorator. A view that rendered incomplete data calls skip_etag(), so
+    the browser can't keep revalidating that page against the same ETag.
+    """
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            user = get_current_user()
+            if request.method != 'GET' or not user or not user.get('section'):
+                return f(*args, **kwargs)
+
+            etag, versions = content_etag(user, kinds)
+            # A pending flash message has to be rendered, so never skip the view then
+            if request.if_none_match.contains_weak(etag) and not session.get('_flashes'):
+                res = make_response('', 304)
+            else:
+                res = make_response(f(*args, **kwargs))
+                if res.status_code != 200:
+                    return res
+                if g.get('skip_etag'):
+                    res.headers['Cache-Control'] = 'no-store'
+                    return res
+            res.set_etag(etag, weak=True)
+            updated = [versions[kind][1] for kind in kinds if versions[kind][1]]
+            if updated:
+                res.headers['Last-Modified'] = formatdate(max(updated), usegmt=True)
+            res.headers['Cache-Control'] = 'private, no-cache'
+            res.vary.add('Cookie')
+            return res
+        return wrapper
+    return decorator
+
+
+COMPRESS_MIN_SIZE = 500  # bytes; smaller bodies aren't worth the CPU or the header
+
+try:
+    import brotli
+except ImportError:  # optional; gzip is used instead
+    brotli = None
+
+
+def compress_response(res):
+    """after_request hook: brotli- or gzip-encode JSON bodies the client accepts."""
+    res.vary.add('Accept-Encoding')
+    if (res.status_code != 200 or res.direct_passthrough or res.mimetype != 'application/json'
+            or 'Content-Encoding' in res.headers):
+        return res
+    body = res.get_data()
+    if len(body) < COMPRESS_MIN_SIZE:
+        return res
+
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br']:
+        res.set_data(brotli.compress(body, quality=5))
+        res.headers['Content-Encoding'] = 'br'
+    elif accepted['gzip']:
+        res.set_data(gzip.compress(body, compresslevel=6))
+        res.headers['Content-Encoding'] = 'gzip'
+    return res